@@ -1,17 +1,25 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import json
+import hashlib
 import os
-from typing import List, Optional, Literal, Dict
+from typing import Any, List, Optional, Literal, Dict, Tuple, Union
 import logging
-
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field, constr, validator
+import threading
+
+from cachetools import LRUCache
+import numpy as np
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import ORJSONResponse, StreamingResponse
+import orjson
+from pydantic import BaseModel, ConfigDict, Field, constr, field_validator
 from starlette.middleware.cors import CORSMiddleware
 
 # Vertex AI SDK
 import vertexai
 from vertexai.language_models import TextEmbeddingModel
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 import google.cloud.logging
 from google.cloud import language_v1
 
@@ -31,27 +39,76 @@ EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "text-embedding-005")
 PROMPT_SYSTEM_PATH = "prompts/topics/system.md"
 PROMPT_USER_PATH = "prompts/topics/user.md"
 DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1")
+# Upper bound on headlines per /topics call; prompt size (and latency) grows with it
+TOPICS_MAX_ITEMS = int(os.getenv("TOPICS_MAX_ITEMS", "200"))
+# Upper bound on texts per /entities:batch call (one Cloud NL request each, run concurrently)
+ENTITIES_BATCH_MAX = int(os.getenv("ENTITIES_BATCH_MAX", "64"))
 
 with open(PROMPT_SYSTEM_PATH, "r", encoding="utf-8") as f:
     SYSTEM_PROMPT = f.read().strip()
 with open(PROMPT_USER_PATH, "r", encoding="utf-8") as f:
     USER_PROMPT_TEMPLATE = f.read().strip()
 
+# Static parts of the /topics messages, built once
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+_USER_PREFIX = USER_PROMPT_TEMPLATE + "\n\nInput:\n\n```\n"
+_USER_SUFFIX = "\n```"
+
 
 # Vertex allows up to 2048 inputs per call; keep conservative for latency/memory
 DEFAULT_MAX_BATCH = int(os.getenv("MAX_BATCH", "256"))
+# Vertex limits tokens per input and per request; token counts are estimated
+# from character length (~4 chars/token), so budgets keep some headroom.
+MAX_INPUT_TOKENS = int(os.getenv("MAX_INPUT_TOKENS", "2048"))
+MAX_BATCH_TOKENS = int(os.getenv("MAX_BATCH_TOKENS", "16000"))
+_CHARS_PER_TOKEN = 4
+# Worker threads for the (sync-only) Vertex SDK, kept apart from the default
+# executor that asyncio.to_thread and FastAPI's sync routes share
+EMBED_POOL = int(os.getenv("EMBED_POOL", "16"))
+# Max number of Vertex batch calls in flight at once (across all requests)
+VERTEX_CONCURRENCY = int(os.getenv("VERTEX_CONCURRENCY", "8"))
+# Small concurrent embedding requests are merged into one Vertex call; this is
+# how long (ms) the first queued text waits for company before being sent.
+COALESCE_WAIT_MS = float(os.getenv("COALESCE_WAIT_MS", "10"))
+
+# Embeddings and entity analyses are pure functions of their input, so repeat
+# texts are served from an in-process LRU instead of calling the model again.
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+ENTITIES_CACHE_SIZE = int(os.getenv("ENTITIES_CACHE_SIZE", "4096"))
 
 if not PROJECT_ID:
     raise RuntimeError(
         "Missing GCP project. Set the env var GCP_PROJECT (or GOOGLE_CLOUD_PROJECT)."
     )
 
-# Initialize Vertex once at import time (Cloud Run keeps the instance warm when possible)
-vertexai.init(project=PROJECT_ID, location=LOCATION)
-_model = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_NAME)
+# Vertex and Cloud NL are initialized on first use (and warmed concurrently at
+# startup) rather than at import, so their blocking setup doesn't add up serially
+# on a cold start.
+_model: Optional[TextEmbeddingModel] = None
+_model_lock = threading.Lock()
+
+def _get_model() -> TextEmbeddingModel:
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                vertexai.init(project=PROJECT_ID, location=LOCATION)
+                _model = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL_NAME)
+    return _model
+
+_vertex_sem = asyncio.Semaphore(VERTEX_CONCURRENCY)
+_embed_pool = ThreadPoolExecutor(max_workers=EMBED_POOL, thread_name_prefix="vertex")
 
 # --- NEW: Initialize Cloud NL once ------------------------------------------
-_nl_client = language_v1.LanguageServiceClient()
+_nl_client: Optional[language_v1.LanguageServiceAsyncClient] = None
+
+def _get_nl_client() -> language_v1.LanguageServiceAsyncClient:
+    # Only called from the event loop thread (the async gRPC channel binds to it),
+    # so no lock is needed here.
+    global _nl_client
+    if _nl_client is None:
+        _nl_client = language_v1.LanguageServiceAsyncClient()
+    return _nl_client
 
 # --------------------------------------------------------------------------------------
 # FastAPI app
@@ -70,8 +127,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Keep warm HTTP/2 connections to OpenAI so back-to-back calls skip the TCP+TLS handshake
+_openai_http = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0),
+    timeout=httpx.Timeout(60.0, connect=10.0),
+)
+
+@app.on_event("startup")
+async def _warm_clients():
+    loop = asyncio.get_running_loop()
+    _get_nl_client()
+    await loop.run_in_executor(_embed_pool, _get_model)
+
 try:
-    openai_client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    openai_client = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"], http_client=_openai_http)
 except KeyError as e:
     logging.warning("OPENAI_API_KEY not set; /embed/gpt and /topics endpoints will fail.")
     openai_client = None
@@ -83,6 +153,8 @@ except KeyError as e:
 # Keep types literal for discoverability; Vertex supports these task types.
 TaskType = Optional[Literal["RETRIEVAL_QUERY", "RETRIEVAL_DOCUMENT", "SEMANTIC_SIMILARITY",
                             "CLASSIFICATION", "CLUSTERING"]]
+# Output element type for embeddings; f16/i8 shrink the payload for vector stores
+EmbedDType = Literal["f32", "f16", "i8"]
 
 class TextEmbedRequest(BaseModel):
     inputs: List[constr(strip_whitespace=True, min_length=1)] = Field(
@@ -91,6 +163,9 @@ class TextEmbedRequest(BaseModel):
     batch_size: Optional[int] = Field(
         None, ge=1, le=2048, description="Override internal batching (default 256)."
     )
+    dtype: EmbedDType = Field(
+        "f32", description="Output type: f32, f16, or i8 (L2-normalized, scaled by 127)."
+    )
 
 class WordEmbedRequest(BaseModel):
     words: List[constr(strip_whitespace=True, min_length=1)] = Field(
@@ -103,9 +178,12 @@ class WordEmbedRequest(BaseModel):
     )
 
 class EmbedResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore", arbitrary_types_allowed=True)
+
     model: str
     dimension: int
     count: int
+    dtype: EmbedDType = "f32"
     embeddings: List[List[float]]
 
 # --- NEW: Entity models ------------------------------------------------------
@@ -141,6 +219,25 @@ class EntitiesResponse(BaseModel):
     language: str
     entities: List[Entity]
 
+class EntitiesBatchRequest(BaseModel):
+    # Blank texts are not rejected here; they get an error in their own result slot
+    texts: List[constr(strip_whitespace=True)] = Field(
+        ..., min_length=1, max_length=ENTITIES_BATCH_MAX
+    )
+    language: Optional[str] = Field(
+        default=None,
+        description="BCP-47 language code applied to all texts. If not provided, detected per text."
+    )
+    encoding: Optional[Literal["UTF8", "UTF16", "UTF32"]] = "UTF8"
+
+class EntitiesBatchError(BaseModel):
+    status_code: int
+    error: str
+
+class EntitiesBatchResponse(BaseModel):
+    # same order as the request texts; a failed text does not fail the others
+    results: List[Union[EntitiesResponse, EntitiesBatchError]]
+
 class EmbeddingIn(BaseModel):
     input: list[str] | str
     model: str = "text-embedding-3-small"  # tiny, cheap; swap as needed
@@ -150,88 +247,358 @@ class TopicItem(BaseModel):
     text: str = Field(..., description="Original headline text.")
     entities: List[str] = Field(..., description="List of precomputed entities for the headline.")
 
-    @validator("entities")
+    @field_validator("entities")
+    @classmethod
     def no_none_entities(cls, v):
         if any(e is None for e in v):
             raise ValueError("entities cannot contain nulls")
         return v
 
 class TopicBatchRequest(BaseModel):
-    items: List[TopicItem] = Field(..., min_items=1)
+    items: List[TopicItem] = Field(..., min_length=1, max_length=TOPICS_MAX_ITEMS)
+    stream: bool = Field(
+        False, description="Return NDJSON, one object per headline as soon as the model emits it."
+    )
 
 # --------------------------------------------------------------------------------------
 # Helpers
 # --------------------------------------------------------------------------------------
 
-def _chunked(lst: List[str], n: int):
-    for i in range(0, len(lst), n):
-        yield lst[i:i+n]
+_embed_cache: LRUCache = LRUCache(maxsize=EMBED_CACHE_SIZE)
+_entities_cache: LRUCache = LRUCache(maxsize=ENTITIES_CACHE_SIZE)
+
+def _cache_key(*parts: str) -> str:
+    return hashlib.blake2b("\x00".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+def _approx_tokens(text: str) -> int:
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+def _split_long_text(text: str) -> List[str]:
+    """Split a text over MAX_INPUT_TOKENS into overlapping windows."""
+    window = MAX_INPUT_TOKENS * _CHARS_PER_TOKEN
+    if len(text) <= window:
+        return [text]
+    step = window - window // 8
+    return [text[i:i + window] for i in range(0, len(text) - window // 8, step)]
+
+def _pack_batches(lst: List[str], max_items: int, max_tokens: int):
+    """Yield consecutive batches bounded by both item count and estimated tokens."""
+    batch: List[str] = []
+    tokens = 0
+    for text in lst:
+        t = _approx_tokens(text)
+        if batch and (len(batch) >= max_items or tokens + t > max_tokens):
+            yield batch
+            batch, tokens = [], 0
+        batch.append(text)
+        tokens += t
+    if batch:
+        yield batch
+
+def _embed_sync(batch: List[str]):
+    return _get_model().get_embeddings(batch)
+
+async def _vertex_batch(batch: List[str]):
+    async with _vertex_sem:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_embed_pool, _embed_sync, batch)
+
+class _EmbeddingCoalescer:
+    """
+    Merges concurrent small embedding requests into a single Vertex call.
+
+    Submissions are queued until the next one would overflow `max_batch`
+    texts / `max_tokens` estimated tokens, or `max_wait` seconds have passed
+    since the first one, then sent as one batch and the vectors are handed
+    back to each waiter. Submissions that already fill a batch bypass the queue.
+    If a merged batch fails, each submission is retried on its own so only the
+    one with the offending input fails.
+    """
 
-def _vertex_embed(
+    def __init__(self, max_batch: int, max_tokens: int, max_wait: float):
+        self.max_batch = max_batch
+        self.max_tokens = max_tokens
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+
+    async def submit(self, texts: List[str]) -> list:
+        tokens = sum(_approx_tokens(t) for t in texts)
+        if len(texts) >= self.max_batch or tokens >= self.max_tokens:
+            return await _vertex_batch(texts)
+        if self._worker is None:
+            # created lazily so the queue and task bind to the server's loop
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, tokens, fut))
+        return await fut
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        carry = None
+        while True:
+            first = carry or await self._queue.get()
+            carry = None
+            pending = [first]
+            size, tokens = len(first[0]), first[1]
+            deadline = loop.time() + self.max_wait
+            while True:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if size + len(item[0]) > self.max_batch or tokens + item[1] > self.max_tokens:
+                    # doesn't fit: send what we have, start the next batch with it
+                    carry = item
+                    break
+                pending.append(item)
+                size += len(item[0])
+                tokens += item[1]
+            task = asyncio.create_task(self._dispatch(pending))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    @classmethod
+    async def _dispatch(cls, pending: list) -> None:
+        texts = [t for chunk, _, _ in pending for t in chunk]
+        try:
+            result = await _vertex_batch(texts)
+        except Exception as e:
+            if len(pending) > 1:
+                # Don't fail every merged request for one bad input: retry each
+                # waiter's own chunk so only the request that caused it fails.
+                await asyncio.gather(*(cls._dispatch([item]) for item in pending))
+                return
+            fut = pending[0][2]
+            if not fut.done():
+                fut.set_exception(e)
+            return
+        pos = 0
+        for chunk, _, fut in pending:
+            if not fut.done():
+                fut.set_result(result[pos:pos + len(chunk)])
+            pos += len(chunk)
+
+_embed_coalescer = _EmbeddingCoalescer(DEFAULT_MAX_BATCH, MAX_BATCH_TOKENS, COALESCE_WAIT_MS / 1000)
+
+async def _vertex_embed(
     inputs: List[str],
     batch_size: Optional[int] = None
 ) -> EmbedResponse:
     """
     Calls Vertex AI TextEmbeddingModel with batching.
-    Returns a unified EmbedResponse.
+    Returns a unified EmbedResponse whose embeddings are a float32 (count, dim) ndarray.
+
+    The Vertex SDK is sync-only, so each batch runs on the dedicated Vertex
+    thread pool to keep the event loop free while waiting on the network. Inputs are
+    grouped into length-homogeneous batches which are sent concurrently
+    (capped by VERTEX_CONCURRENCY); small batches may be merged with those
+    of other in-flight requests by the coalescer. Texts already in the
+    embedding cache are not sent at all.
     """
     if not inputs:
         raise HTTPException(status_code=400, detail="No inputs provided.")
 
     bsize = min(batch_size or DEFAULT_MAX_BATCH, 2048)
 
-    vectors: List[List[float]] = []
-    reported_dim: Optional[int] = None
+    vectors: List[np.ndarray] = [None] * len(inputs)  # type: ignore[list-item]
+    keys = [_cache_key(EMBEDDING_MODEL_NAME, text) for text in inputs]
+    misses: List[int] = []
+    for i, key in enumerate(keys):
+        cached = _embed_cache.get(key)
+        if cached is None:
+            misses.append(i)
+        else:
+            vectors[i] = cached
+
+    # Texts over the per-input token limit are split into overlapping windows
+    # whose vectors are mean-pooled back into one vector per text below.
+    pieces: List[str] = []
+    owners: List[int] = []
+    for i in misses:
+        for piece in _split_long_text(inputs[i]):
+            pieces.append(piece)
+            owners.append(i)
+
+    # Batch texts of similar length together so one long document doesn't
+    # drag a whole batch to the long-tail latency (or padding cost); results
+    # are scattered back to the caller's order below.
+    order = sorted(range(len(pieces)), key=lambda k: len(pieces[k]))
+    sorted_pieces = [pieces[k] for k in order]
+
+    # Only a request's last (partial) batch goes through the coalescer, and only
+    # when the caller left the batch size to us; the others are already packed.
+    batches = list(_pack_batches(sorted_pieces, bsize, MAX_BATCH_TOKENS))
+    last = len(batches) - 1 if batch_size is None else -1
+    sends = [
+        _embed_coalescer.submit(batch) if k == last else _vertex_batch(batch)
+        for k, batch in enumerate(batches)
+    ]
 
     try:
-        for batch in _chunked(inputs, bsize):
-            result = _model.get_embeddings(batch)
-
-            # result is a list of Embedding objects with .values (List[float])
-            for emb in result:
-                vec = list(emb.values)
-                if reported_dim is None:
-                    reported_dim = len(vec)
-                vectors.append(vec)
-
-        dim = reported_dim or 0
-
-        return EmbedResponse(
+        results = await asyncio.gather(*sends)
+
+        # gather preserves batch order; each result is a list of Embedding objects
+        # with .values (List[float]). Convert a whole batch in one numpy call and
+        # scatter its rows into the float32 matrix in a single indexed assignment.
+        piece_vectors: Optional[np.ndarray] = None
+        k = 0
+        for result in results:
+            if not result:
+                continue
+            block = np.array([emb.values for emb in result], dtype=np.float32)
+            if piece_vectors is None:
+                piece_vectors = np.empty((len(pieces), block.shape[1]), dtype=np.float32)
+            piece_vectors[order[k:k + len(result)]] = block
+            k += len(result)
+
+        grouped: Dict[int, List[int]] = {}
+        for k, owner in enumerate(owners):
+            grouped.setdefault(owner, []).append(k)
+        for i, idx in grouped.items():
+            # copy so cached rows don't keep the whole batch matrix alive
+            vec = piece_vectors[idx[0]].copy() if len(idx) == 1 else piece_vectors[idx].mean(axis=0)
+            vectors[i] = vec
+            _embed_cache[keys[i]] = vec
+
+        out = np.stack(vectors)
+
+        # don't re-validate N x dim numbers; orjson serializes the ndarray natively
+        return EmbedResponse.model_construct(
             model=EMBEDDING_MODEL_NAME,
-            dimension=dim,
-            count=len(vectors),
-            embeddings=vectors,
+            dimension=out.shape[1],
+            count=out.shape[0],
+            embeddings=out,
         )
     except Exception as e:
         # Surface a concise error; full trace in Cloud Logging
         raise HTTPException(status_code=502, detail=f"Vertex embedding call failed: {e}")
     
 
-def _format_entities_as_python_list(entities: List[str]) -> str:
+def _quantize(vectors: np.ndarray, dtype: str) -> np.ndarray:
+    """Convert a float32 (count, dim) matrix to the requested output type."""
+    if dtype == "f16":
+        return vectors.astype(np.float16)
+    if dtype == "i8":
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        unit = vectors / np.maximum(norms, 1e-12)
+        return np.clip(np.round(unit * 127), -128, 127).astype(np.int8)
+    return vectors
+
+def _embed_json(resp: EmbedResponse) -> ORJSONResponse:
+    """Serialize an EmbedResponse with orjson, bypassing response_model re-validation."""
+    # ORJSONResponse renders with OPT_SERIALIZE_NUMPY, so the embeddings ndarray
+    # is written out directly without materializing Python floats
+    return ORJSONResponse(content=dict(resp))
+
+def _format_entities_as_list(entities: List[str]) -> str:
     """
-    The model expects the entity line as something like:
-    ['Blue Angels', 'National Mall', 'streets', 'DC', 'National Guard']
-    Use repr() to preserve quotes/escapes robustly.
+    The model expects the entity line as a list literal, e.g.
+    ["Blue Angels", "National Mall", "streets", "DC", "National Guard"]
+    A JSON array reads the same to the model and orjson escapes it robustly in C.
     """
-    return "[" + ", ".join(repr(e) for e in entities) + "]"
+    return orjson.dumps(entities).decode()
 
 def _build_user_prompt_block(items: List[TopicItem]) -> str:
     """
     Build the Input: block that the user prompt asks for:
-    Headline on one line, entity Python-like list on the next line, repeated.
+    Headline on one line, entity list on the next line, repeated.
     Keep exact text spacing/punctuation as provided.
     """
     lines = []
     for it in items:
         lines.append(it.text)
-        lines.append(_format_entities_as_python_list(it.entities))
-    block = "\n".join(lines)
-    return USER_PROMPT_TEMPLATE + "\n\nInput:\n\n```\n" + block + "\n```"
+        lines.append(_format_entities_as_list(it.entities))
+    return "".join((_USER_PREFIX, "\n".join(lines), _USER_SUFFIX))
+
+class _JSONArrayItemParser:
+    """
+    Incrementally splits a streamed top-level JSON array of objects into items.
+
+    feed() takes text as it arrives and returns the items completed by it;
+    only the item currently being generated is kept in memory. Items that are
+    not objects (scalars, nested arrays) are dropped and counted in `skipped`.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._in_scalar = False
+        self.done = False
+        self.skipped = 0
+
+    def feed(self, chunk: str) -> list:
+        buf = self._buf + chunk
+        start = self._start
+        items = []
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+                if self._depth == 1:  # string item
+                    self.skipped += 1
+            elif ch in "[{":
+                self._depth += 1
+                if self._depth == 2:
+                    start = i
+            elif ch in "]}":
+                self._in_scalar = False
+                self._depth -= 1
+                if self._depth == 1 and start is not None:
+                    if buf[start] == "{":
+                        items.append(orjson.loads(buf[start:i + 1]))
+                    else:
+                        self.skipped += 1
+                    start = None
+                elif self._depth == 0:
+                    self.done = True
+            elif self._depth == 1:
+                # number / true / false / null item, up to the next separator
+                if ch == "," or ch.isspace():
+                    self._in_scalar = False
+                elif not self._in_scalar:
+                    self._in_scalar = True
+                    self.skipped += 1
+            i += 1
+        cut = start if start is not None else i
+        self._buf = buf[cut:]
+        self._pos = i - cut
+        self._start = 0 if start is not None else None
+        return items
 
 # --- NEW: Entities helper ----------------------------------------------------
 _LV1 = language_v1  # alias for brevity
 
-def _analyze_entities(
+# Proto enum value -> name, resolved once instead of per entity/mention
+_ENTITY_TYPE_NAMES = {t.value: t.name for t in _LV1.Entity.Type}
+_MENTION_TYPE_NAMES = {t.value: t.name for t in _LV1.EntityMention.Type}
+
+# EntitiesRequest.encoding is validated to one of these exact keys
+_ENCODING_TYPES = {
+    "UTF8": _LV1.EncodingType.UTF8,
+    "UTF16": _LV1.EncodingType.UTF16,
+    "UTF32": _LV1.EncodingType.UTF32,
+}
+_DEFAULT_DOC_TYPE = _LV1.Document.Type.PLAIN_TEXT
+
+async def _analyze_entities(
     text: str,
     language: Optional[str] = None,
     encoding: str = "UTF8",
@@ -239,56 +606,60 @@ def _analyze_entities(
     if not text:
         raise HTTPException(status_code=400, detail="No text provided.")
 
-    now = datetime.now()
-    # Build Document
-    doc_kwargs = {
-        "content": text,
-        "type_": _LV1.Document.Type.PLAIN_TEXT,
-    }
-    if language:
-        doc_kwargs["language"] = language
-    document = doc_kwargs
-
-    # Map encoding str to enum
-    enc_map = {
-        "UTF8": _LV1.EncodingType.UTF8,
-        "UTF16": _LV1.EncodingType.UTF16,
-        "UTF32": _LV1.EncodingType.UTF32,
-    }
-    encoding_type = enc_map.get(encoding.upper(), _LV1.EncodingType.UTF8)
+    cache_key = _cache_key(language or "", encoding, text)
+    analysis = _entities_cache.get(cache_key)
+    if analysis is None:
+        analysis = await _nl_entities(text, language, encoding)
+        _entities_cache[cache_key] = analysis
+    return _entities_response(analysis, datetime.now())
+
+# Cached per text: (language, [(name, type, metadata, salience, [(mention text, mention type)])]).
+# Mention times are not part of it; they are stamped per request.
+_EntitiesAnalysis = Tuple[str, List[Tuple[str, str, Dict[str, str], float, List[Tuple[str, str]]]]]
+
+async def _nl_entities(text: str, language: Optional[str], encoding: str) -> _EntitiesAnalysis:
+    document = _LV1.Document(content=text, type_=_DEFAULT_DOC_TYPE, language=language or "")
+    encoding_type = _ENCODING_TYPES.get(encoding, _LV1.EncodingType.UTF8)
 
     try:
-        response = _nl_client.analyze_entities(
-            request={"document": document, "encoding_type": encoding_type}
+        response = await _get_nl_client().analyze_entities(
+            request=_LV1.AnalyzeEntitiesRequest(document=document, encoding_type=encoding_type)
         )
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"Cloud NL analyze_entities failed: {e}")
 
-    ents: List[Entity] = []
-    for ent in response.entities:
-        # Type name from enum
-        ent_type: EntityType = _LV1.Entity.Type(ent.type_).name  # type: ignore
-        mentions = [
-            EntityMention(
-                text=m.text.content,
-                type=_LV1.EntityMention.Type(m.type_).name,
-                salience=float(ent.salience),
-                time=now
-            )
-            for m in ent.mentions
-        ]
-        # metadata is a Mapping[str, str]
-        md = dict(ent.metadata)
-        ents.append(
-            Entity(
-                name=ent.name,
+    ents = [
+        (
+            ent.name,
+            _ENTITY_TYPE_NAMES[ent.type_],  # type name from enum
+            dict(ent.metadata),  # metadata is a Mapping[str, str]
+            float(ent.salience),
+            [(m.text.content, _MENTION_TYPE_NAMES[m.type_]) for m in ent.mentions],
+        )
+        for ent in response.entities
+    ]
+    return response.language or (language or "und"), ents
+
+def _entities_response(analysis: _EntitiesAnalysis, now: datetime) -> EntitiesResponse:
+    language, ents = analysis
+    # Values come straight from the Cloud NL proto, so skip pydantic validation
+    return EntitiesResponse.model_construct(
+        language=language,
+        entities=[
+            Entity.model_construct(
+                name=name,
                 type=ent_type,
                 metadata=md,
-                mentions=mentions
+                mentions=[
+                    EntityMention.model_construct(
+                        text=m_text, type=m_type, salience=salience, time=now
+                    )
+                    for m_text, m_type in mentions
+                ],
             )
-        )
-
-    return EntitiesResponse(language=response.language or (language or "und"), entities=ents)
+            for name, ent_type, md, salience, mentions in ents
+        ],
+    )
 
 # --------------------------------------------------------------------------------------
 # Routes
@@ -304,52 +675,77 @@ def healthz():
     }
 
 @app.post("/embed/text", response_model=EmbedResponse)
-def embed_text(payload: TextEmbedRequest):
+async def embed_text(payload: TextEmbedRequest):
     """
     Embeds arbitrary texts (sentences/paragraphs/documents) using Vertex AI text-embedding model.
     """
-    return _vertex_embed(
+    resp = await _vertex_embed(
         inputs=payload.inputs,
         batch_size=payload.batch_size,
     )
+    if payload.dtype != "f32":
+        resp.embeddings = _quantize(resp.embeddings, payload.dtype)
+        resp.dtype = payload.dtype
+    return _embed_json(resp)
 
 @app.post("/embed/word", response_model=EmbedResponse)
-def embed_word(payload: WordEmbedRequest):
+async def embed_word(payload: WordEmbedRequest):
     """
     Embeds words by calling the same Vertex model on each word.
     This keeps deployment simple and avoids maintaining separate word-vector files.
     """
     # Reuse the same path; you could set a different task_type here if desired.
-    return _vertex_embed(
+    return _embed_json(await _vertex_embed(
         inputs=payload.words,
-        task_type=payload.task_type,
         batch_size=payload.batch_size,
-    )
+    ))
 
 @app.post("/embed/gpt")
-def embed(body: EmbeddingIn):
+async def embed(body: EmbeddingIn):
     # Accepts a string or list of strings
-    resp = openai_client.embeddings.create(model=body.model, input=body.input)
+    resp = await openai_client.embeddings.create(model=body.model, input=body.input)
     # Standardize to list-of-vectors output
     vectors = [d.embedding for d in resp.data]
     return {"model": resp.model, "vectors": vectors}
 
 @app.post("/entities", response_model=EntitiesResponse)
-def entities(payload: EntitiesRequest):
+async def entities(payload: EntitiesRequest):
     """
     Extracts entities from text using Google Cloud Natural Language API.
     Returns canonical entity names, types, salience, metadata (e.g., wikipedia_url, mid),
     and the list of mentions (text and mention type).
     """
-    return _analyze_entities(
+    return await _analyze_entities(
         text=payload.text,
         language=payload.language,
         encoding=payload.encoding or "UTF8",
     )
 
 
+@app.post("/entities:batch", response_model=EntitiesBatchResponse)
+async def entities_batch(payload: EntitiesBatchRequest):
+    """
+    Same as /entities for several texts in one round-trip; results are in input order.
+    Cloud NL analyzes one document per request, so the texts are analyzed concurrently.
+    A text that fails (blank, Cloud NL error) gets an EntitiesBatchError in its slot.
+    """
+    unique = list(dict.fromkeys(payload.texts))
+    analyzed = await asyncio.gather(*(
+        _analyze_entities(text=t, language=payload.language, encoding=payload.encoding or "UTF8")
+        for t in unique
+    ), return_exceptions=True)
+    by_text = {}
+    for t, res in zip(unique, analyzed):
+        if isinstance(res, HTTPException):
+            res = EntitiesBatchError(status_code=res.status_code, error=str(res.detail))
+        elif isinstance(res, Exception):
+            res = EntitiesBatchError(status_code=500, error=f"{type(res).__name__}: {res}")
+        by_text[t] = res
+    return EntitiesBatchResponse.model_construct(results=[by_text[t] for t in payload.texts])
+
+
 @app.post("/topics")
-def extract_topics(req: TopicBatchRequest):
+async def extract_topics(req: TopicBatchRequest):
     """
     CURRENTLY UNUSED.
 
@@ -360,54 +756,75 @@ def extract_topics(req: TopicBatchRequest):
     Cuurently we just take the entities in the text as topics,
     so this is left here for future reference.
     """
+    # Duplicate headlines (same text and entities) are sent to the model once;
+    # index_map[i] is the position in `unique` that original item i maps to.
+    seen: Dict[tuple, int] = {}
+    unique: List[TopicItem] = []
+    index_map: List[int] = []
+    for it in req.items:
+        key = (it.text, tuple(it.entities))
+        j = seen.get(key)
+        if j is None:
+            j = seen[key] = len(unique)
+            unique.append(it)
+        index_map.append(j)
+
     # Build the user prompt from the incoming batch
-    user_prompt = _build_user_prompt_block(req.items)
+    user_prompt = _build_user_prompt_block(unique)
 
     try:
-        # Call the Responses API with system + user messages
-        resp = openai_client.responses.create(
+        # Call the Responses API with system + user messages, streaming the output
+        # so topic objects can be parsed (and optionally returned) as they complete
+        events = await openai_client.responses.create(
             model=DEFAULT_MODEL,
             input=[
-                {"role": "system", "content": SYSTEM_PROMPT},
+                _SYSTEM_MESSAGE,
                 {"role": "user", "content": user_prompt},
             ],
+            stream=True,
         )
     except Exception as e:
         raise HTTPException(status_code=502, detail=f"OpenAI request failed: {e}")
 
-    # The Responses API provides a convenience .output_text for pure-text results.
-    # If not present in your SDK version, fall back to traversing the content array.
-    output_text = getattr(resp, "output_text", None)
-    if not output_text:
-        # Fallback extraction (works with many client versions)
-        try:
-            # Newer Responses API shape:
-            # resp.output -> list of content parts; each part may have .content[0].text
-            # We'll try common possibilities.
-            if hasattr(resp, "output") and resp.output:
-                # Try to join any text parts
-                parts = []
-                for item in resp.output:
-                    for c in getattr(item, "content", []) or []:
-                        if getattr(c, "type", None) == "output_text" and hasattr(c, "text"):
-                            parts.append(c.text)
-                output_text = "\n".join(parts).strip() if parts else None
-            # Legacy fallback
-            if not output_text and hasattr(resp, "choices"):
-                output_text = resp.choices[0].message["content"]
-        except Exception:
-            pass
-
-    if not output_text:
-        raise HTTPException(status_code=500, detail="Could not read model output.")
+    parser = _JSONArrayItemParser()
+
+    async def _topics():
+        # Re-expand to one result per original item, in input order, emitting
+        # each as soon as the model has produced its unique headline.
+        results: List[Any] = []
+        cursor = 0
+        async for event in events:
+            if event.type == "response.output_text.delta":
+                results.extend(parser.feed(event.delta))
+                while cursor < len(index_map) and index_map[cursor] < len(results):
+                    yield results[index_map[cursor]]
+                    cursor += 1
+        if parser.skipped:
+            logging.warning(
+                "/topics: model output had %d non-object array item(s), skipped; "
+                "got %d topic objects for %d unique headlines (TOPICS_MAX_ITEMS=%d)",
+                parser.skipped, len(results), len(unique), TOPICS_MAX_ITEMS,
+            )
+
+    if req.stream:
+        async def _ndjson():
+            try:
+                async for item in _topics():
+                    yield orjson.dumps(item) + b"\n"
+            except Exception:
+                # headers are already sent; log and end the stream
+                logging.exception("Streaming /topics failed")
+        return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
 
     # Ensure the model returned valid JSON (a list of objects)
     try:
-        parsed = json.loads(output_text)
-    except json.JSONDecodeError as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Model did not return valid JSON. Error: {e}. Raw output: {output_text}",
-        )
+        parsed = [item async for item in _topics()]
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(status_code=500, detail=f"Model did not return valid JSON. Error: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"OpenAI stream failed: {e}")
+    if not parser.done:
+        raise HTTPException(status_code=500, detail="Model output was not a complete JSON array.")
 
-    return parsed
\ No newline at end of file
+    # Already plain JSON data; skip FastAPI's jsonable_encoder + json.dumps pass
+    return Response(content=orjson.dumps(parsed), media_type="application/json")
\ No newline at end of file
@@ -0,0 +1,53 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+
+def _import_api():
+    # Prompts are read relative to the service dir; Cloud Logging needs credentials.
+    os.environ.setdefault("GCP_PROJECT", "test-project")
+    cwd = os.getcwd()
+    os.chdir(API_DIR)
+    try:
+        with mock.patch("google.cloud.logging.Client"):
+            import ai_api
+    finally:
+        os.chdir(cwd)
+    return ai_api
+
+
+ai_api = _import_api()
+
+
+class EmbedDTypeTest(unittest.TestCase):
+    def setUp(self):
+        vectors = np.array([[0.1, -1.5, 0.333], [2.0, 0.0, -0.25]], dtype=np.float32)
+        resp = ai_api.EmbedResponse.model_construct(
+            model="test-model", dimension=3, count=2, embeddings=vectors
+        )
+        patcher = mock.patch.object(ai_api, "_vertex_embed", mock.AsyncMock(return_value=resp))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.vectors = vectors
+        self.client = TestClient(ai_api.app)
+
+    def test_f16_embeddings_serialize(self):
+        r = self.client.post("/embed/text", json={"inputs": ["a", "b"], "dtype": "f16"})
+
+        self.assertEqual(r.status_code, 200, r.text)
+        body = r.json()
+        self.assertEqual(body["dtype"], "f16")
+        np.testing.assert_array_equal(
+            np.array(body["embeddings"], dtype=np.float16), self.vectors.astype(np.float16)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,14 @@
 from datetime import datetime
-from typing import List, Optional, Tuple
-from dash import Dash, ctx, dcc, html, Input, Output, State, no_update
+import os
+from typing import Dict, Optional, Sequence, Tuple
+from dash import Patch, ctx, dcc, html, Input, Output, State, no_update
+from dash_extensions.enrich import DashProxy, FileSystemBackend, Serverside, ServersideOutputTransform
 import plotly
 import plotly.express as px
 import pandas as pd
 import numpy as np
 
+import async_loop
 from news_data_loader import NewsDataLoader
 from article_smart_cache import article_cache
 
@@ -20,28 +23,51 @@ gm2007 = gm[gm["year"] == 2007].drop_duplicates("iso_alpha")
 iso_to_country = dict(zip(gm2007["iso_alpha"], gm2007["country"]))
 all_iso = gm2007["iso_alpha"].tolist()
 
-def make_map_figure(series_by_iso3: pd.Series, selected_iso3: Optional[str], colorbar_title: str) -> "plotly.graph_objs._figure.Figure":
-    """Build choropleth for a given ISO3->value series."""
-    # align to known ISO-3 codes so hover/click behaves consistently
-    df = pd.DataFrame({"iso_alpha": all_iso})
-    series = pd.Series(series_by_iso3, dtype="float64")
-    df["value"] = df["iso_alpha"].map(series)
-
-    # Determine range (optional: auto if empty or all-zero)
-    if series.size > 0 and series.max(skipna=True) > 0:
-        zmin = float(np.nanmin(df["value"]))
-        zmax = float(np.nanmax(df["value"]))
-        # guard if all values nan
-        if not np.isfinite(zmin) or not np.isfinite(zmax):
-            zmin, zmax = None, None
-    else:
-        zmin = zmax = None
+# Country counts travel through the stores as arrays aligned to all_iso,
+# so they can be used as map values without re-indexing.
+_ISO_ORDER = tuple(all_iso)
+_ISO_POS = {iso3: i for i, iso3 in enumerate(all_iso)}
+_ALL_ISO = np.array(all_iso)
+_ISO_HOVER = np.array([iso_to_country.get(i, i) for i in all_iso])
+
+
+def _count_for(counts: Optional[Sequence[int]], iso3: Optional[str]) -> Optional[Dict[str, int]]:
+    """{iso3: count} from all_iso-aligned counts, or None if unknown."""
+    pos = _ISO_POS.get(iso3) if iso3 else None
+    if pos is None or counts is None or len(counts) == 0:
+        return None
+    return {iso3: int(counts[pos])}
+
+
+# Per-hour per-country counts are small; uint16 is plenty and serializes as plain ints
+_Z_MAX = np.iinfo(np.uint16).max
+
+
+def _map_values(counts: Optional[Sequence[int]]) -> Tuple[np.ndarray, Optional[float], Optional[float]]:
+    """Map values for all_iso-aligned counts as uint16 (0 = no mentions) and their color range."""
+    if counts is None or len(counts) == 0:
+        return np.zeros(len(all_iso), dtype=np.uint16), None, None
+    z = np.clip(counts, 0, _Z_MAX).astype(np.uint16)
+
+    # Determine range over countries with mentions (auto if there are none)
+    present = z[z > 0]
+    if present.size:
+        return z, float(present.min()), float(present.max())
+    return z, None, None
+
+
+def make_map_figure(counts: Optional[Sequence[int]], selected_iso3: Optional[str], colorbar_title: str) -> "plotly.graph_objs._figure.Figure":
+    """
+    Build choropleth for per-country counts aligned to all_iso.
+    data[0] is the value layer, data[1] the selected-country marker (empty when
+    nothing is selected), so both can be updated in place with a Patch.
+    """
+    z, zmin, zmax = _map_values(counts)
 
     fig = px.choropleth(
-        df,
-        locations="iso_alpha",
-        color="value",
-        hover_name=df["iso_alpha"].map(iso_to_country),
+        locations=_ALL_ISO,
+        color=np.where(z > 0, z, np.nan),  # no mentions: left uncolored
+        hover_name=_ISO_HOVER,
         color_continuous_scale="Viridis",
         range_color=(zmin, zmax) if (zmin is not None and zmax is not None) else None,
         scope="world",
@@ -57,25 +83,42 @@ def make_map_figure(series_by_iso3: pd.Series, selected_iso3: Optional[str], col
     fig.update_geos(showframe=False, showcoastlines=True, coastlinecolor="#888", bgcolor="rgba(0,0,0,0)")
     fig.update_layout(margin=dict(l=0, r=0, t=0, b=0), clickmode="event+select", uirevision="keep")
 
-    # Outline selected country (if any)
-    if selected_iso3:
-        sel_df = df[df["iso_alpha"] == selected_iso3].copy()
-        sel_df["value"] = np.nan
-        fig.add_choropleth(
-            locations=sel_df["iso_alpha"],
-            z=sel_df["value"],
-            locationmode="ISO-3",
-            marker_line_color="#222",
-            marker_line_width=2.5,
-            colorscale=[[0, "rgba(0,0,0,0)"], [1, "rgba(0,0,0,0)"]],
-            showscale=False,
-            hoverinfo="skip",
-        )
+    # Mark selected country (if any): a single ring at its centroid, not a second map-sized trace
+    fig.add_scattergeo(
+        locations=[selected_iso3] if selected_iso3 else [],
+        locationmode="ISO-3",
+        mode="markers",
+        marker=dict(symbol="circle-open", size=18, line=dict(width=2.5, color="#222"), color="#222"),
+        showlegend=False,
+        hoverinfo="skip",
+    )
 
     return fig
 
 
-app = Dash(__name__)
+def map_patch(counts: Optional[Sequence[int]], selected_iso3: Optional[str], colorbar_title: str) -> Patch:
+    """Same result as make_map_figure, as a partial update of the figure currently shown."""
+    z, zmin, zmax = _map_values(counts)
+    p = Patch()
+    p["data"][0]["z"] = [c or None for c in z.tolist()]  # no mentions: null, left uncolored
+    p["layout"]["coloraxis"]["cmin"] = zmin
+    p["layout"]["coloraxis"]["cmax"] = zmax
+    p["layout"]["coloraxis"]["colorbar"]["title"]["text"] = colorbar_title
+    p["data"][1]["locations"] = [selected_iso3] if selected_iso3 else []
+    return p
+
+
+# Full figure is built once; interactions only patch values, range, title and outline.
+_BASE_FIGURE = make_map_figure(None, None, "All topics — mentions")
+
+
+# Store payloads (count arrays, top-entity lists) are only read by other server
+# callbacks, so they are kept server-side; the browser just holds a key.
+SERVERSIDE_DIR = os.getenv("SERVERSIDE_DIR", "/tmp/news_atlas_serverside")
+app = DashProxy(
+    __name__,
+    transforms=[ServersideOutputTransform(backends=[FileSystemBackend(cache_dir=SERVERSIDE_DIR)])],
+)
 server = app.server
 app.title = "News Topics Map — Firestore + Dash"
 
@@ -151,6 +194,7 @@ app.layout = html.Div(
                         # --- Map ---
                         dcc.Graph(
                             id="world-map",
+                            figure=_BASE_FIGURE,
                             style={"height": "72vh", "border": "1px solid #ddd", "borderRadius": "10px"}
                         ),
                     ],
@@ -194,9 +238,9 @@ app.layout = html.Div(
         dcc.Store(id="hour-store", data=None),
         dcc.Store(id="selected-iso3", data=None),           # single-country selection (or None)
         dcc.Store(id="active-topic", data=None),            # currently active topic (or None)
-        dcc.Store(id="country-totals-store", data={}),      # { ISO3: count } for hour
+        dcc.Store(id="country-totals-store", data=[]),      # counts for hour, aligned to all_iso
         dcc.Store(id="global-top-entities-store", data=[]), # [ (topic, count), ... ] for hour
-        dcc.Store(id="entity-breakdown-store", data={}),    # { ISO3: count } for active topic
+        dcc.Store(id="entity-breakdown-store", data=[]),    # counts for active topic, aligned to all_iso
     ],
 )
 
@@ -212,30 +256,24 @@ app.layout = html.Div(
 def load_hour_data(hour):
     """Fetch country totals and global top topics for the hour."""
     if not hour:  # <-- guard
-        return {}, []
-    # country totals
-    totals = loader.country_totals(hour)
-    totals_dict = totals.astype(int).to_dict()
-
-    # global top entities (pairs so we can show counts in labels if desired)
-    tops = loader.top_entities(hour, limit=20)
-    tops_list: List[Tuple[str, int]] = [(str(name), int(count)) for name, count in tops.items()]
+        return [], []
+    # country totals + global top entities, fetched concurrently
+    # global top entities come as (topic, count) pairs so we can show counts in labels
+    totals, tops_list = async_loop.run_all(
+        loader.country_totals(hour, _ISO_ORDER),
+        loader.top_entities_items(hour, limit=20),
+    )
 
-    return totals_dict, tops_list
+    # prefetch articles for the most likely next clicks while the map renders
+    article_cache.warm(
+        hour=hour,
+        entities=[name for name, _ in tops_list[:5]],
+        countries=[all_iso[i] for i in np.argsort(-totals, kind="stable")[:10] if totals[i] > 0],
+        loader=loader,
+    )
 
+    return Serverside(totals), Serverside(tops_list)
 
-# When active topic changes, fetch country breakdown for that entity
-@app.callback(
-    Output("entity-breakdown-store", "data"),
-    Input("active-topic", "data"),
-    State("hour-store", "data"),
-    prevent_initial_call=True,
-)
-def load_entity_breakdown(active_topic, hour):
-    if not active_topic :
-        return {}
-    s = loader.country_breakdown_for_entity(hour, active_topic)
-    return {k: int(v) for k, v in s.items()}
 
 # -----------------------------
 # Hour selector logic
@@ -251,7 +289,7 @@ def load_entity_breakdown(active_topic, hour):
     prevent_initial_call=False,
 )
 def init_hours(_):
-    hours = loader.list_hours()
+    hours = async_loop.run(loader.list_hours())
 
     # Fallback to the hardcoded hour if Firestore is unreachable/empty.
     if not hours:
@@ -307,24 +345,42 @@ def build_topics_panel(selected_iso3, global_tops, hour):
     - Country selected: fetch that country's top topics.
     """
     if selected_iso3:
-        # Country-specific top 1
+        # Country-specific top topics
+        name = iso_to_country.get(selected_iso3, selected_iso3)
         try:
-            by_country = loader.top_entities_by_country(hour, selected_iso3, limit=20)
-            if not by_country.empty:
-                header = f"Hot topics in {iso_to_country.get(selected_iso3, selected_iso3)}"
-                options = [{"label": f"{name} ({count})", "value": name} for name, count in (by_country.items() or [])]
-                return header, options, None
-            else:
-                header = f"No topics found for {iso_to_country.get(selected_iso3, selected_iso3)}"
-                return header, [], None
+            by_country = async_loop.run(loader.top_entities_by_country(hour, selected_iso3, limit=20))
         except Exception:
-            header = f"Topics unavailable for {iso_to_country.get(selected_iso3, selected_iso3)}"
-            return header, [], None
-    else:
-        # Global panel
-        header = "Global hot topics"
-        options = [{"label": f"{name} ({count})", "value": name} for name, count in (global_tops or [])]
-        return header, options, None
+            return f"Topics unavailable for {name}", [], None
+        if by_country.empty:
+            return f"No topics found for {name}", [], None
+        options = [{"label": f"{topic} ({count})", "value": topic} for topic, count in by_country.items()]
+        return f"Hot topics in {name}", options, None
+
+    # Global panel
+    header = "Global hot topics"
+    options = [{"label": f"{name} ({count})", "value": name} for name, count in (global_tops or [])]
+    return header, options, None
+
+
+# When the active topic (or the hour's data) changes, fetch the country breakdown
+# for that entity. Kept apart from build_topics_panel: that one writes
+# topic-chooser.value, which feeds active-topic, so taking active-topic as an
+# Input there would be a circular dependency.
+@app.callback(
+    Output("entity-breakdown-store", "data"),
+    Input("active-topic", "data"),
+    Input("global-top-entities-store", "data"),
+    State("hour-store", "data"),
+    prevent_initial_call=True,
+)
+def load_entity_breakdown(active_topic, _global_tops, hour):
+    if not active_topic:
+        return []
+    try:
+        counts = async_loop.run(loader.country_breakdown_for_entity(hour, active_topic, _ISO_ORDER))
+    except Exception:
+        return []
+    return Serverside(counts)
 
 
 # Clicking a topic activates it (colors the map by that entity)
@@ -385,15 +441,21 @@ def toggle_country(click_data, selected_iso3):
     Input("active-topic", "data"),
     Input("selected-iso3", "data"),
 )
-def render_map(totals_dict, entity_dict, active_topic, selected_iso3):
-    if active_topic and entity_dict:
-        series = pd.Series(entity_dict, dtype="float64")
+def render_map(totals, entity_counts, active_topic, selected_iso3):
+    if ctx.triggered_id == "selected-iso3":
+        # values are unchanged; only move the selection marker
+        p = Patch()
+        p["data"][1]["locations"] = [selected_iso3] if selected_iso3 else []
+        return p
+
+    if active_topic and entity_counts is not None and len(entity_counts) > 0:
+        counts = entity_counts
         colorbar_title = f"{active_topic} — mentions"
     else:
-        series = pd.Series(totals_dict or {}, dtype="float64")
+        counts = totals
         colorbar_title = "All topics — mentions"
 
-    return make_map_figure(series, selected_iso3, colorbar_title)
+    return map_patch(counts, selected_iso3, colorbar_title)
 
 
 @app.callback(
@@ -405,7 +467,7 @@ def render_map(totals_dict, entity_dict, active_topic, selected_iso3):
     State("entity-breakdown-store", "data"),
     State("global-top-entities-store", "data"),
 )
-def update_articles_list(hour, iso3, topic, totals_dict, entity_dict, global_tops):
+def update_articles_list(hour, iso3, topic, totals, entity_counts, global_tops):
     if not hour:
         return html.Div("No hour selected.", style={"color": "#666"})
 
@@ -414,8 +476,8 @@ def update_articles_list(hour, iso3, topic, totals_dict, entity_dict, global_top
             hour=hour,
             country=iso3,
             entity=topic,
-            totals_by_iso=totals_dict if isinstance(totals_dict, dict) else None,
-            entity_breakdown_by_iso=entity_dict if isinstance(entity_dict, dict) else None,
+            totals_by_iso=_count_for(totals, iso3),
+            entity_breakdown_by_iso=_count_for(entity_counts, iso3),
             global_top_entities=global_tops if isinstance(global_tops, list) else None,
             loader=loader,
             per_page=3,
@@ -1,10 +1,29 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
-from datetime import datetime
+import heapq
+import os
+import threading
+from datetime import datetime, timezone
 from typing import Dict, Any, Iterable, Optional, Tuple
 
-import pandas as pd
+import diskcache
 
-from news_data_loader import NewsDataLoader
+import async_loop
+from news_data_loader import NewsDataLoader, LIVE_HOUR_WINDOW
+
+# On-disk store shared by all workers of an instance. On Cloud Run the local
+# filesystem is in-memory (and per instance), so the cache counts against the
+# instance's memory limit and starts empty after every restart; keep the size
+# well below that limit unless ARTICLE_CACHE_DIR is a mounted volume.
+ARTICLE_CACHE_DIR = os.getenv("ARTICLE_CACHE_DIR", "/var/cache/news_atlas")
+ARTICLE_CACHE_SIZE = int(os.getenv("ARTICLE_CACHE_SIZE", str(32 * 2**20)))  # bytes
+PAST_HOUR_TTL = 24 * 3600  # seconds
+LIVE_HOUR_TTL = 5 * 60     # seconds; articles for recent hours are still arriving
+# Bump when the shape of cached rows changes (e.g. what _prepare adds)
+_CACHE_VERSION = 1
+
+# Background prefetch of likely-next selections (see SmartArticleCache.warm)
+_warm_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="article-warm")
 
 @dataclass
 class SmartArticleCache:
@@ -23,37 +42,74 @@ class SmartArticleCache:
     in the cache for the old filter and check if we have all articles for the
     new filter already present. If not, we load them from the DB.
     """
-    store: Dict[str, list] = field(default_factory=dict)
+    store: diskcache.Cache = field(
+        default_factory=lambda: diskcache.Cache(ARTICLE_CACHE_DIR, size_limit=ARTICLE_CACHE_SIZE)
+    )
+    # Prefetch bookkeeping (see warm): the hour currently worth warming, and
+    # keys queued or being fetched so they are not submitted twice.
+    _warm_hour: Optional[str] = field(default=None, init=False, repr=False)
+    _warm_pending: set = field(default_factory=set, init=False, repr=False)
+    _warm_lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
 
     @staticmethod
     def _key(hour: str, country: Optional[str], entity: Optional[str]) -> str:
-        return f"{hour}|{country or ''}|{entity or ''}"
+        return f"v{_CACHE_VERSION}|{hour}|{country or ''}|{entity or ''}"
+
+    @staticmethod
+    def _ttl(hour: str) -> int:
+        live_from = (datetime.now(timezone.utc) - LIVE_HOUR_WINDOW).strftime("%Y%m%d%H")
+        return LIVE_HOUR_TTL if hour >= live_from else PAST_HOUR_TTL
+
+    def _put(self, hour: str, key: str, rows: list) -> None:
+        self.store.set(key, rows, expire=self._ttl(hour))
+
+    @staticmethod
+    def _to_epoch(v) -> float:
+        """
+        Sort key for an article `time`: epoch seconds, -inf when missing/unparseable.
+        Handles datetimes (incl. Firestore's DatetimeWithNanoseconds), anything else
+        exposing .timestamp(), and ISO-8601 strings (with or without a trailing 'Z').
+        """
+        try:
+            if isinstance(v, str):
+                return datetime.fromisoformat(v).timestamp()
+            if hasattr(v, "timestamp"):
+                return float(v.timestamp())
+        except (ValueError, TypeError, OverflowError):
+            pass
+        return float("-inf")
+
+    @classmethod
+    def _prepare(cls, rows: Iterable[Dict[str, Any]]) -> list:
+        """
+        Annotates fetched articles once, at insert time, with what filtering and
+        sorting need: a lowercase slug set and `time` as epoch seconds.
+        """
+        out = []
+        for r in rows:
+            slugs = r.get("entityNameSlug")
+            if isinstance(slugs, (list, tuple, set)):
+                r["_slug_lowset"] = {str(s).lower() for s in slugs}
+            r["_ts"] = cls._to_epoch(r.get("time"))
+            out.append(r)
+        return out
 
     @staticmethod
-    def _matches(article: Dict[str, Any], country: Optional[str], entity: Optional[str]) -> bool:
+    def _matches(article: Dict[str, Any], country: Optional[str], entity: Optional[str],
+                 ent_slug: Optional[str]) -> bool:
         if country and article.get("country") != country:
             return False
         if entity:
-            slugs = article.get("entityNameSlug")
-            if not isinstance(slugs, (list, tuple, set)):
+            lowset = article.get("_slug_lowset")
+            if lowset is None:
                 return False
-            ent_slug = entity.lower().replace(" ", "-")
-            lowset = {str(s).lower() for s in slugs}
-            if (ent_slug not in lowset) and (entity not in slugs):
+            if (ent_slug not in lowset) and (entity not in article["entityNameSlug"]):
                 return False
         return True
 
     @staticmethod
     def _sort_trim(rows: Iterable[Dict[str, Any]], limit: int = 3) -> list:
-        def _to_dt(v):
-            if isinstance(v, datetime):
-                return v
-            try:
-                return pd.to_datetime(v)
-            except Exception:
-                return datetime.min
-        rows_sorted = sorted(rows, key=lambda r: _to_dt(r.get("time")), reverse=True)
-        return rows_sorted[:limit]
+        return heapq.nlargest(limit, rows, key=lambda r: r["_ts"])
 
     @staticmethod
     def _expected_count(
@@ -102,37 +158,87 @@ class SmartArticleCache:
         key = self._key(hour, country, entity)
 
         # 1) Exact cache hit
-        if key in self.store:
-            return self._sort_trim(self.store[key], per_page)
+        rows = self.store.get(key)
+        if rows is not None:
+            return self._sort_trim(rows, per_page)
 
         # 2) Try to fulfill from a less restrictive cached parent if we have "enough"
         expected = self._expected_count(
             country, entity, totals_by_iso, entity_breakdown_by_iso, global_top_entities
         )
 
+        ent_slug = entity.lower().replace(" ", "-") if entity else None
         parent_keys = []
         if country and entity:
             parent_keys.append(self._key(hour, country, None))  # country only
             parent_keys.append(self._key(hour, None, entity))   # entity only
 
-        for pkey in parent_keys:
-            if expected is not None and pkey in self.store:
-                parent_rows = self.store[pkey] or []
-                filtered = [r for r in parent_rows if self._matches(r, country, entity)]
+        for pkey in parent_keys if expected is not None else ():
+            parent_rows = self.store.get(pkey)
+            if parent_rows is not None:
+                filtered = [r for r in parent_rows if self._matches(r, country, entity, ent_slug)]
                 if len(filtered) >= expected:
                     # We have all we need for the stricter filter
-                    self.store[key] = filtered
+                    self._put(hour, key, filtered)
                     return self._sort_trim(filtered, per_page)
 
         # 3) Fallback to DB; cache exact key
-        fetched = loader.load_articles(
+        rows = self._fetch(loader, hour, country, entity, per_page)
+        self._put(hour, key, rows)
+        return self._sort_trim(rows, per_page)
+
+    def _fetch(self, loader: NewsDataLoader, hour: str, country: Optional[str],
+               entity: Optional[str], per_page: int) -> list:
+        fetched = async_loop.run(loader.load_articles(
             hour=hour,
             country=country or None,
             entity=entity or None,
             limit=per_page,
-        )
-        self.store[key] = fetched or []
-        return self._sort_trim(self.store[key], per_page)
+        ))
+        return self._prepare(fetched or [])
+
+    def _warm_one(self, loader: NewsDataLoader, hour: str, country: Optional[str],
+                  entity: Optional[str], per_page: int) -> None:
+        key = self._key(hour, country, entity)
+        try:
+            # queued for an hour the user has since moved away from
+            if hour != self._warm_hour or key in self.store:
+                return
+            rows = self._fetch(loader, hour, country, entity, per_page)
+            # add() never replaces an entry get() wrote in the meantime
+            self.store.add(key, rows, expire=self._ttl(hour))
+        except Exception:
+            pass  # best effort; get() will fetch on demand
+        finally:
+            with self._warm_lock:
+                self._warm_pending.discard(key)
+
+    def warm(
+        self,
+        *,
+        hour: str,
+        entities: Iterable[str],
+        countries: Iterable[str],
+        loader: NewsDataLoader,
+        per_page: int = 3,
+    ) -> None:
+        """
+        Prefetches in the background the selections a user is most likely to make
+        next (single entity, single country) so get() finds them in the cache.
+        Does not block the caller. Jobs still queued for a previously warmed hour
+        are skipped, so dragging the hour slider doesn't back up the pool.
+        """
+        if not hour:
+            return
+        jobs = [(None, name) for name in entities] + [(iso3, None) for iso3 in countries]
+        with self._warm_lock:
+            self._warm_hour = hour
+            for country, entity in jobs:
+                key = self._key(hour, country, entity)
+                if key in self._warm_pending:
+                    continue
+                self._warm_pending.add(key)
+                _warm_pool.submit(self._warm_one, loader, hour, country, entity, per_page)
 
 # Create a singleton instance for this process
 article_cache = SmartArticleCache()
@@ -0,0 +1,32 @@
+# async_loop.py
+"""
+A process-wide asyncio event loop running on a daemon thread.
+
+Dash callbacks are synchronous; they hand coroutines (Firestore AsyncClient
+queries) to this loop and block on the result, so independent queries can be
+in flight at the same time instead of running back to back.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Any, Awaitable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+_loop = asyncio.new_event_loop()
+threading.Thread(target=_loop.run_forever, name="async-loop", daemon=True).start()
+
+
+def run(aw: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Run a coroutine on the background loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(aw, _loop).result(timeout)
+
+
+async def _gather(*aws: Awaitable[Any]) -> List[Any]:
+    return await asyncio.gather(*aws)
+
+
+def run_all(*aws: Awaitable[Any], timeout: Optional[float] = None) -> List[Any]:
+    """Run several coroutines concurrently on the background loop; results in order."""
+    return run(_gather(*aws), timeout)
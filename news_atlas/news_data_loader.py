@@ -1,22 +1,73 @@
 # news_data_loader.py
 from __future__ import annotations
 
-from typing import List, Optional, Dict, Any
+from datetime import datetime, timedelta, timezone
+import functools
+import threading
+from typing import List, Optional, Dict, Any, MutableMapping, Sequence, Tuple
 import re
 
+from cachetools import LRUCache, TTLCache
+import numpy as np
 import pandas as pd
 from google.cloud import firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
 
 
 _slug_re = re.compile(r"[^\w\s-]", re.UNICODE)
+_slug_ws_re = re.compile(r"\s+")
+@functools.lru_cache(maxsize=4096)
 def slugify(s: str, max_len: int = 128) -> str:
+    # must stay identical to news_processor's slugify: it produces the entity doc ids
     s = (s or "").lower()
     s = _slug_re.sub("", s)
-    s = re.sub(r"\s+", "-", s.strip())
+    s = _slug_ws_re.sub("-", s.strip())
     return s[:max_len] or "entity"
 
 
+# Rollups for an hour keep changing while articles for it are still being
+# processed; older hours are immutable and can be cached indefinitely.
+LIVE_HOUR_WINDOW = timedelta(hours=2)
+LIVE_CACHE_TTL = 60  # seconds
+_MISSING = object()
+
+
+def _hour_cached(fn):
+    """
+    Memoizes an async per-hour query on (method, hour, *args). Results are
+    shared between callers and must not be mutated.
+    """
+    @functools.wraps(fn)
+    async def wrapper(self: "NewsDataLoader", hour: str, *args, **kwargs):
+        key = (fn.__name__, hour, *args, *sorted(kwargs.items()))
+        cache = self._cache_for(hour)
+        with self._cache_lock:
+            hit = cache.get(key, _MISSING)
+        if hit is not _MISSING:
+            return hit
+        value = await fn(self, hour, *args, **kwargs)
+        with self._cache_lock:
+            cache[key] = value
+        return value
+    return wrapper
+
+
+@functools.lru_cache(maxsize=8)
+def _iso_positions(iso_order: Tuple[str, ...]) -> Dict[str, int]:
+    return {iso3: i for i, iso3 in enumerate(iso_order)}
+
+
+def _aligned(rows: Dict[str, int], iso_order: Sequence[str]) -> np.ndarray:
+    """Counts per ISO3 as an int64 array in `iso_order` (0 where absent; unknown codes dropped)."""
+    pos = _iso_positions(tuple(iso_order))
+    out = np.zeros(len(pos), dtype=np.int64)
+    for iso3, count in rows.items():
+        i = pos.get(iso3)
+        if i is not None:
+            out[i] = count
+    return out
+
+
 class NewsDataLoader:
     """
     Reads per-hour rollups from:
@@ -25,9 +76,11 @@ class NewsDataLoader:
       /mentions/{hour}/countries/{ISO3}
         { country, total, entities: { entityId: count }, ... }
 
-    All methods return pandas.Series:
-      - index: entity names (for entity-oriented queries) or ISO3 codes (for country-oriented)
-      - values: integer counts
+    All query methods are coroutines backed by firestore.AsyncClient, so
+    independent queries can run concurrently. Entity-oriented rollup queries
+    return pandas.Series (index: entity names, values: integer counts);
+    country-oriented ones return int64 arrays aligned to a caller-given ISO3
+    order, ready to be used as map values.
     """
 
     def __init__(
@@ -40,24 +93,57 @@ class NewsDataLoader:
             client_kwargs["project"] = project_id
         if database:
             client_kwargs["database"] = database
-        self.db = firestore.Client(**client_kwargs)
+        self._client_kwargs = client_kwargs
+        self._db: Optional[firestore.AsyncClient] = None
+
+        self._cache_lock = threading.Lock()
+        self._past_cache: MutableMapping = LRUCache(maxsize=512)
+        self._live_cache: MutableMapping = TTLCache(maxsize=256, ttl=LIVE_CACHE_TTL)
+        self._hours_cache: MutableMapping = TTLCache(maxsize=1, ttl=LIVE_CACHE_TTL)
 
-    def list_hours(self) -> List[str]:
+    @property
+    def db(self) -> firestore.AsyncClient:
+        # Created on first use so the async gRPC channel binds to the loop running the queries.
+        if self._db is None:
+            self._db = firestore.AsyncClient(**self._client_kwargs)
+        return self._db
+
+    async def list_hours(self) -> List[str]:
         """
         Returns all available mention hours (document IDs) from /mentions,
         sorted ascending (e.g., '2025102908'). Filters to 10-digit YYYYMMDDHH.
+        Cached for LIVE_CACHE_TTL seconds.
         """
+        with self._cache_lock:
+            hit = self._hours_cache.get("hours", _MISSING)
+        if hit is not _MISSING:
+            return hit
+        # Document refs only; the hour docs' bodies are never needed here.
         coll = self.db.collection("mentions")
-        hours = [snap.id for snap in coll.stream()]
-        hours = [h for h in hours if re.fullmatch(r"\d{10}", h)]
-        print(hours)
-        return sorted(hours)
+        hours = sorted([
+            ref.id async for ref in coll.list_documents()
+            if len(ref.id) == 10 and ref.id.isdigit()
+        ])
+        with self._cache_lock:
+            self._hours_cache["hours"] = hours
+        return hours
 
     # ---------- Helpers ----------
-    def _mentions_hour_ref(self, hour: str) -> firestore.DocumentReference:
+    def _cache_for(self, hour: str) -> MutableMapping:
+        live_from = (datetime.now(timezone.utc) - LIVE_HOUR_WINDOW).strftime("%Y%m%d%H")
+        return self._live_cache if hour >= live_from else self._past_cache
+
+    def invalidate(self, hour: str) -> None:
+        """Drop cached query results for `hour` (e.g. when it is known to have new data)."""
+        with self._cache_lock:
+            for cache in (self._live_cache, self._past_cache):
+                for key in [k for k in cache.keys() if k[1] == hour]:
+                    cache.pop(key, None)
+
+    def _mentions_hour_ref(self, hour: str) -> firestore.AsyncDocumentReference:
         return self.db.collection("mentions").document(hour)
     
-    def load_articles(
+    async def load_articles(
         self,
         hour: str,
         country: Optional[str] = None,
@@ -89,7 +175,7 @@ class NewsDataLoader:
             q = q.limit(int(limit))
 
         rows = []
-        for snap in q.stream():
+        async for snap in q.stream():
             dd = snap.to_dict() or {}
             rows.append({"id": snap.id, **dd})
 
@@ -97,26 +183,29 @@ class NewsDataLoader:
 
 
     # ---------- 1) number of news per country ----------
-    def country_totals(self, hour: str) -> pd.Series:
+    @_hour_cached
+    async def country_totals(self, hour: str, iso_order: Tuple[str, ...]) -> np.ndarray:
         """
-        Returns a Series indexed by ISO3 with 'total' per country in this hour.
+        Returns 'total' per country in this hour, aligned to `iso_order`.
         """
-        docs = self._mentions_hour_ref(hour).collection("countries").stream()
+        # Project to the one field used; country docs also carry the full entity breakdown.
+        docs = self._mentions_hour_ref(hour).collection("countries").select(["total"]).stream()
         data = {}
-        for d in docs:
+        async for d in docs:
             if not d.exists:
                 continue
             dd = d.to_dict() or {}
             iso3 = d.id  # countries collection document ids are ISO3
             total = int(dd.get("total", 0) or 0)
             data[iso3] = total
-        return pd.Series(data, dtype="int64").sort_index()
+        return _aligned(data, iso_order)
 
     # ---------- 2) number of news per entity (global) sorted & limited ----------
-    def top_entities(self, hour: str, limit: int = 20) -> pd.Series:
+    @_hour_cached
+    async def top_entities_items(self, hour: str, limit: int = 20) -> List[Tuple[str, int]]:
         """
-        Returns top-N entities globally for this hour.
-        Index = entity names, values = total mentions.
+        Returns top-N entities globally for this hour as (entity name, total mentions)
+        pairs, highest first.
         """
         q = (
             self._mentions_hour_ref(hour)
@@ -125,15 +214,25 @@ class NewsDataLoader:
             .limit(limit)
         )
         data = {}
-        for d in q.stream():
+        async for d in q.stream():
             dd = d.to_dict() or {}
-            name = dd.get("entity") or d.id  # prefer human-readable name
+            name = str(dd.get("entity") or d.id)  # prefer human-readable name
             total = int(dd.get("total", 0) or 0)
             data[name] = total
-        return pd.Series(data, dtype="int64").sort_values(ascending=False)
+        # already ordered by Firestore (order_by total desc); dicts keep that order
+        return list(data.items())
+
+    async def top_entities(self, hour: str, limit: int = 20) -> pd.Series:
+        """
+        Returns top-N entities globally for this hour.
+        Index = entity names, values = total mentions.
+        """
+        pairs = await self.top_entities_items(hour, limit)
+        return pd.Series([c for _, c in pairs], index=[n for n, _ in pairs], dtype="int64")
 
     # ---------- 3) number of news per entity for a given country sorted & limited ----------
-    def top_entities_by_country(self, hour: str, iso3: str, limit: int = 20) -> pd.Series:
+    @_hour_cached
+    async def top_entities_by_country(self, hour: str, iso3: str, limit: int = 20) -> pd.Series:
         """
         Reads from: /mentions/{hour}/countries/{ISO3}/entities/*
         Returns top-N entities for a specific ISO3 country in this hour.
@@ -149,21 +248,24 @@ class NewsDataLoader:
         )
 
         data = {}
-        for d in q.stream():
+        async for d in q.stream():
             dd = d.to_dict() or {}
             name = dd.get("entity") or dd.get("entityId") or d.id
             count = int(dd.get("count", 0) or 0)
             if count > 0:
                 data[name] = count
 
-        return pd.Series(data, dtype="int64").sort_values(ascending=False)
+        # already ordered by Firestore (order_by count desc); dicts keep that order
+        return pd.Series(list(data.values()), index=list(data.keys()), dtype="int64")
 
     # ---------- 4) number of news per country for a given entity ----------
-    def country_breakdown_for_entity(self, hour: str, entity_name: str) -> pd.Series:
+    @_hour_cached
+    async def country_breakdown_for_entity(
+        self, hour: str, entity_name: str, iso_order: Tuple[str, ...]
+    ) -> np.ndarray:
         """
         Reads from: /mentions/{hour}/entities/{entityId}/countries/*
-        Returns counts per ISO3 for the given entity in this hour.
-        Index = ISO3, values = counts.
+        Returns counts per country for the given entity in this hour, aligned to `iso_order`.
         """
         eid = slugify(entity_name)
         countries_coll = (
@@ -174,10 +276,10 @@ class NewsDataLoader:
         )
 
         data = {}
-        for c in countries_coll.stream():
+        async for c in countries_coll.select(["count", "country"]).stream():
             dd = c.to_dict() or {}
             iso3 = dd.get("country") or c.id
             count = int(dd.get("count", 0) or 0)
             data[iso3] = count
 
-        return pd.Series(data, dtype="int64").sort_index()
+        return _aligned(data, iso_order)
@@ -1,18 +1,107 @@
 
 
+import asyncio
+import base64
+import fcntl
+import hashlib
+import json
 import logging
-from typing import Any, Dict, List, Optional
+import os
+from typing import Any, Dict, List, Optional, Tuple
 import time as pytime
 
 from google.oauth2 import id_token
 from google.auth.transport.requests import Request
+import httpx
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-import google.cloud.logging
+# ID tokens are shared between worker processes through a small file in tmpfs
+TOKEN_CACHE_DIR = os.getenv("AIAPI_TOKEN_CACHE_DIR", "/dev/shm")
+TOKEN_EXPIRY_MARGIN = 30  # seconds; refresh this long before the token's `exp`
+TOKEN_FALLBACK_TTL = 50 * 60  # seconds; only used if `exp` cannot be read
+# Texts per /entities:batch call; must not exceed ai_api's ENTITIES_BATCH_MAX
+ENTITIES_BATCH_MAX = int(os.getenv("ENTITIES_BATCH_MAX", "64"))
 
-client = google.cloud.logging.Client()
 
-client.setup_logging()
+def _jwt_exp(token: str) -> Optional[float]:
+    """`exp` claim (epoch seconds) of a JWT, read without verifying the signature."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, KeyError, TypeError, ValueError):
+        return None
+
+
+class EntitiesBatchError(Exception):
+    """The AI API could not analyze one text of an /entities:batch call."""
+
+    def __init__(self, status_code: int, error: str):
+        super().__init__(f"{status_code}: {error}")
+        self.status_code = status_code
+
+
+def _batch_item(r: Dict[str, Any]) -> Any:
+    """One /entities:batch result: the text's entity dicts, or its error as an EntitiesBatchError."""
+    if "error" in r:
+        return EntitiesBatchError(int(r.get("status_code") or 500), str(r["error"]))
+    return r.get("entities", [])
+
+
+# Plain-text /entities output is "<label>: <value>" lines; candidate labels keyed by first character
+_ENTITY_LINE_PREFIXES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "R": (("Representative name for the entity:", "rep_name"),),
+    "E": (("Entity type:", "type"),),
+    "S": (("Salience score:", "salience"),),
+    "M": (("Mention text:", "mention_text"), ("Mention type:", "mention_type")),
+}
+
+
+def _parse_entities_text(raw: str) -> List[Dict[str, Any]]:
+    """Single pass over the plain-text /entities output; a new entity starts at each representative name."""
+    ents: List[Dict[str, Any]] = []
+    cur: Dict[str, Any] = {}
+    pos, end = 0, len(raw)
+    while pos < end:
+        nl = raw.find("\n", pos)
+        if nl < 0:
+            nl = end
+        line = raw[pos:nl].strip()
+        pos = nl + 1
+        if not line:
+            continue
+
+        for prefix, field in _ENTITY_LINE_PREFIXES.get(line[0], ()):
+            if line.startswith(prefix):
+                value = line[len(prefix):].strip()
+                break
+        else:
+            continue
+
+        if field == "rep_name":
+            if cur:
+                ents.append(cur)
+                cur = {}
+            cur["rep_name"] = value
+        elif field == "salience":
+            try:
+                cur["salience"] = float(value)
+            except ValueError:
+                cur["salience"] = None
+        elif field == "mention_text":
+            cur.setdefault("mentions", []).append({"text": value})
+        elif field == "mention_type":
+            if cur.get("mentions"):
+                cur["mentions"][-1]["type"] = value
+        else:
+            cur[field] = value
+    if cur:
+        ents.append(cur)
+    return ents
+
 
 class AIAPILoader:
     """
@@ -32,22 +121,79 @@ class AIAPILoader:
         self.audience = audience or self.base
         self._cached_token: Optional[str] = None
         self._cached_token_expiry: float = 0.0
+        aud_hash = hashlib.sha1(self.audience.encode("utf-8")).hexdigest()[:16]
+        self._token_file = os.path.join(TOKEN_CACHE_DIR, f"aiapi_token_{aud_hash}.json")
+        self._load_token_file()
+
+        # Keep-alive connection pool so calls reuse a warm TLS connection to the service
+        self._session = requests.Session()
+        self._session.headers.update({"Content-Type": "application/json"})
+        retry = Retry(
+            total=2,
+            backoff_factor=0.2,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=frozenset({"POST"}),  # all AIAPI calls are side-effect free
+            raise_on_status=False,
+        )
+        self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry))
+        # Async counterpart for callers on an event loop; created on first use
+        self._async_http: Optional[httpx.AsyncClient] = None
 
     # -------------------------------------------------------------------------
     # Authentication helper
     # -------------------------------------------------------------------------
 
+    def _token_valid(self) -> bool:
+        return bool(self._cached_token) and pytime.time() < self._cached_token_expiry - TOKEN_EXPIRY_MARGIN
+
+    def _load_token_file(self) -> bool:
+        """Adopt a token another worker cached, if it is still valid."""
+        try:
+            with open(self._token_file, "r") as f:
+                data = json.load(f)
+            self._cached_token, self._cached_token_expiry = data["token"], float(data["exp"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return self._token_valid()
+
+    def _write_token_file(self) -> None:
+        tmp = f"{self._token_file}.{os.getpid()}"
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump({"token": self._cached_token, "exp": self._cached_token_expiry}, f)
+            os.replace(tmp, self._token_file)  # readers never see a partial file
+        except OSError as e:
+            logging.warning("Could not share ID token via %s: %s", self._token_file, e)
+
     def _get_id_token(self) -> str:
-        """Fetch and cache an ID token, supporting local impersonation."""
-        now = pytime.time()
-        if self._cached_token and now < self._cached_token_expiry - 30:
+        """
+        Fetch and cache an ID token until shortly before its `exp`, supporting local
+        impersonation. The token is shared with sibling workers through a tmpfs file;
+        an exclusive flock makes sure only one of them refetches it.
+        """
+        if self._token_valid():
             return self._cached_token
-        
-        token = id_token.fetch_id_token(Request(), self.audience)
 
-        self._cached_token = token
-        self._cached_token_expiry = now + 50 * 60
-        return token
+        try:
+            lock = open(f"{self._token_file}.lock", "a")
+        except OSError:
+            lock = None
+        try:
+            if lock is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if self._load_token_file():  # refreshed by another worker meanwhile
+                    return self._cached_token
+
+            token = id_token.fetch_id_token(Request(), self.audience)
+            self._cached_token = token
+            self._cached_token_expiry = _jwt_exp(token) or pytime.time() + TOKEN_FALLBACK_TTL
+            if lock is not None:
+                self._write_token_file()
+            return token
+        finally:
+            if lock is not None:
+                lock.close()  # releases the flock
 
     def _auth_headers(self) -> Dict[str, str]:
         token = self._get_id_token()
@@ -59,14 +205,40 @@ class AIAPILoader:
 
     def _post_json(self, path: str, payload: Dict[str, Any]) -> Any:
         url = f"{self.base}{path}"
-        headers = {"Content-Type": "application/json"}
-        headers.update(self._auth_headers())
-        r = requests.post(url, json=payload, headers=headers, timeout=self.timeout)
+        # Content-Type is set on the session
+        r = self._session.post(url, data=orjson.dumps(payload), headers=self._auth_headers(), timeout=self.timeout)
         r.raise_for_status()
         # Try JSON, fallback to text
         try:
-            return r.json()
-        except Exception:
+            return orjson.loads(r.content)
+        except orjson.JSONDecodeError:
+            return r.text
+
+    @property
+    def async_http(self) -> httpx.AsyncClient:
+        if self._async_http is None:
+            self._async_http = httpx.AsyncClient(
+                timeout=self.timeout,
+                headers={"Content-Type": "application/json"},
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=32),
+                transport=httpx.AsyncHTTPTransport(retries=2),  # connection errors only
+            )
+        return self._async_http
+
+    async def aclose(self) -> None:
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+
+    async def _post_json_async(self, path: str, payload: Dict[str, Any]) -> Any:
+        # Refreshing the token is blocking (metadata server RPC, file lock); keep it off the loop
+        headers = self._auth_headers() if self._token_valid() else await asyncio.to_thread(self._auth_headers)
+        r = await self.async_http.post(f"{self.base}{path}", content=orjson.dumps(payload), headers=headers)
+        r.raise_for_status()
+        # Try JSON, fallback to text
+        try:
+            return orjson.loads(r.content)
+        except orjson.JSONDecodeError:
             return r.text
 
     def embed_texts(self, texts: List[str], batch_size: Optional[int] = None) -> List[List[float]]:
@@ -97,31 +269,16 @@ class AIAPILoader:
         if not isinstance(raw, str):
             raw = str(raw)
 
-        lines = [ln.strip() for ln in raw.splitlines() if ln.strip()]
-        ents: List[Dict[str, Any]] = []
-        cur: Dict[str, Any] = {}
+        return _parse_entities_text(raw)
 
-        def flush():
-            if cur:
-                ents.append(cur.copy())
-                cur.clear()
-
-        for ln in lines:
-            if ln.startswith("Representative name for the entity:"):
-                flush()
-                cur["rep_name"] = ln.split(":", 1)[1].strip()
-            elif ln.startswith("Entity type:"):
-                cur["type"] = ln.split(":", 1)[1].strip()
-            elif ln.startswith("Salience score:"):
-                try:
-                    cur["salience"] = float(ln.split(":", 1)[1].strip())
-                except Exception:
-                    cur["salience"] = None
-            elif ln.startswith("Mention text:"):
-                cur.setdefault("mentions", [])
-                cur["mentions"].append({"text": ln.split(":", 1)[1].strip()})
-            elif ln.startswith("Mention type:"):
-                if "mentions" in cur and cur["mentions"]:
-                    cur["mentions"][-1]["type"] = ln.split(":", 1)[1].strip()
-        flush()
-        return ents
+    async def extract_entities_batch_async(self, texts: List[str]) -> List[Any]:
+        """
+        Calls /entities:batch once for several texts, without blocking the event loop.
+        Returns each text's entity dicts (same shape as extract_entities' JSON branch),
+        in input order, or an EntitiesBatchError for a text the API could not analyze.
+        """
+        if not texts:
+            return []
+        logging.info("Extracting entities for %d texts", len(texts))
+        data = await self._post_json_async("/entities:batch", {"texts": texts})
+        return [_batch_item(r) for r in data["results"]]
@@ -1,45 +1,114 @@
+import asyncio
 import traceback
-from fastapi import FastAPI, Request, HTTPException
-import base64, json
+from fastapi import FastAPI, HTTPException
+import base64
 import logging
-import google.cloud.logging
+import os
+from typing import List, Tuple
 
-from article_processor import ArticleRaw, ArticleProcessor
+import orjson
+from pydantic import BaseModel
 
-client = google.cloud.logging.Client()
+from ai_api_loader import ENTITIES_BATCH_MAX
+from article_processor import ArticleRaw, ArticleProcessor
+from logging_setup import configure
 
-client.setup_logging()
+configure()
 
 app = FastAPI()
 sb = ArticleProcessor(dry_run=False)  # set False to actually write to Firestore
 
+# Articles from concurrent pushes are grouped so entity extraction is one AI API
+# round-trip per batch. Each push is answered (and so acked) only after its own
+# article has been written.
+# Capped at the AI API's per-call limit, above which it rejects the whole batch.
+BATCH_SIZE = min(int(os.getenv("BATCH_SIZE", "16")), ENTITIES_BATCH_MAX)
+BATCH_WAIT_S = float(os.getenv("BATCH_WAIT_MS", "20")) / 1000
+# Batches processed at the same time; while all slots are busy, new pushes queue
+# up and go out together as the next (larger) batch.
+MAX_INFLIGHT_BATCHES = int(os.getenv("MAX_INFLIGHT_BATCHES", "4"))
+_queue: "asyncio.Queue[Tuple[ArticleRaw, asyncio.Future]]" = asyncio.Queue()
+
+
+async def _run_batch(batch: List[Tuple[ArticleRaw, asyncio.Future]], slots: asyncio.Semaphore):
+    try:
+        try:
+            results = await sb.process_articles_async([a for a, _ in batch])
+        except Exception as e:  # the batch call itself failed (e.g. AI API unreachable)
+            results = [e] * len(batch)
+        for (_, fut), res in zip(batch, results):
+            if fut.done():  # request went away
+                continue
+            if isinstance(res, Exception):
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+    finally:
+        slots.release()
+
+
+async def _batch_worker():
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(MAX_INFLIGHT_BATCHES)
+    running = set()
+    while True:
+        await slots.acquire()
+        batch: List[Tuple[ArticleRaw, asyncio.Future]] = [await _queue.get()]
+        deadline = loop.time() + BATCH_WAIT_S
+        while len(batch) < BATCH_SIZE:
+            try:
+                batch.append(await asyncio.wait_for(_queue.get(), timeout=deadline - loop.time()))
+            except asyncio.TimeoutError:
+                break
+
+        task = asyncio.create_task(_run_batch(batch, slots))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+
+@app.on_event("startup")
+async def _start_batch_worker():
+    app.state.batch_worker = asyncio.create_task(_batch_worker())
+
+
+@app.on_event("shutdown")
+async def _close_clients():
+    await sb.api.aclose()
+
+
+class PubsubMessage(BaseModel):
+    data: str = ""
+
+
+class PubsubEnvelope(BaseModel):
+    # Push requests also carry subscription/attributes/messageId; unused here
+    message: PubsubMessage
+
+
 @app.get("/healthz")
 async def healthz():
     return {"status": "ok"}
 
 
 @app.post("/pubsub")
-async def pubsub_push(request: Request):
-    envelope = await request.json()
-    if not envelope or "message" not in envelope:
-        raise HTTPException(status_code=400, detail="Invalid Pub/Sub push format.")
-
-    msg = envelope["message"]
-    data_b64 = msg.get("data", "")
+async def pubsub_push(env: PubsubEnvelope):
     try:
-        decoded = base64.b64decode(data_b64).decode("utf-8")
-        payload = json.loads(decoded)
+        # orjson takes the decoded bytes directly (and rejects invalid UTF-8 itself)
+        payload = orjson.loads(base64.b64decode(env.message.data))
         article = ArticleRaw.from_dict(payload)
         logging.info(f"Received article for processing: {payload}")
     except Exception as e:
         logging.error("Error decoding Pub/Sub message:\n%s", traceback.format_exc())
         raise HTTPException(status_code=400, detail=f"Bad message: {e}")
     
-    if not article.title:
+    # A blank title has nothing to extract entities from
+    if not (article.title or "").strip():
         return {"ok": True, "note": "No title; skipping processing."}
 
+    fut = asyncio.get_running_loop().create_future()
+    await _queue.put((article, fut))
     try:
-        summary = sb.process_article(article)
+        summary = await fut
         # Return 200 so Pub/Sub acks message
         return {"ok": True, "summary": summary}
     except Exception as e:
@@ -14,14 +14,14 @@ Author: you :)
 
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime
 import json
 import logging
 import os
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import pycountry
-import google.cloud.logging
 
 from ai_api_loader import AIAPILoader
 from datatypes import ArticleRaw
@@ -30,14 +30,19 @@ from firestore_writer import FirestoreWriter
 from utils import normalize_space
 
 
-client = google.cloud.logging.Client()
-
-client.setup_logging()
-
-
 AI_API_BASE = os.getenv("AI_API", "https://ai-api-1010480476071.europe-central2.run.app")
 PROJECT_ID = os.getenv("GCP_PROJECT") or os.getenv("GOOGLE_CLOUD_PROJECT")
 
+# Upper-cased country code/name -> ISO 3166 alpha-3, built once. Same exact
+# (case-insensitive) matches as pycountry.countries.lookup, as a dict hit.
+_CC3: Dict[str, str] = {}
+for _c in pycountry.countries:
+    for _attr in ("alpha_2", "alpha_3", "numeric", "name", "official_name", "common_name"):
+        _v = getattr(_c, _attr, None)
+        if _v:
+            _CC3.setdefault(_v.upper(), _c.alpha_3)
+del _c, _attr, _v
+
 
 
 class ArticleProcessor:
@@ -59,13 +64,72 @@ class ArticleProcessor:
         Runs the full pipeline and writes results.
         Returns a small summary dict.
         """
+        # 1) Entities (canonical + sentence-level spans)
+        # We don't have the body text yet; pass empty string for text.
+        canonical = self.entities_extractor.build(self._full_text(article))
+        return self._write(article, canonical)
+
+    async def process_articles_async(self, articles: List[ArticleRaw]) -> List[Any]:
+        """
+        process_article for several articles, with one entities round-trip for all of them.
+        The entities call is awaited; the (blocking) Firestore writes run in a worker thread.
+        Returns, per article, its summary dict or the exception raised while processing it.
+        """
+        canonicals = await self.entities_extractor.build_many_async([self._full_text(a) for a in articles])
+        return await asyncio.to_thread(self._write_all, articles, canonicals)
+
+    def _write_all(self, articles: List[ArticleRaw], canonicals: List[Any]) -> List[Any]:
+        results: List[Any] = []
+        pending: List[int] = []
+        kwargs: List[Dict[str, Any]] = []
+        for article, canonical in zip(articles, canonicals):
+            if isinstance(canonical, Exception):  # entities failed for this article only
+                logging.error("Error extracting entities for article %s: %s", article.url, canonical)
+                results.append(canonical)
+                continue
+            try:
+                summary, write_kwargs = self._summarize(article, canonical)
+            except Exception as e:
+                logging.exception("Error preparing article %s", article.url)
+                results.append(e)
+                continue
+            results.append(summary)
+            if not self.dry_run:
+                pending.append(len(results) - 1)
+                kwargs.append(write_kwargs)
+        if not kwargs:
+            return results
+
+        # One bulk write for all article docs instead of a transaction each
+        try:
+            used_ids = self.writer.write_articles(kwargs)
+        except Exception as e:
+            logging.exception("Error writing %d articles", len(kwargs))
+            used_ids = [e] * len(kwargs)
+        for i, used_id in zip(pending, used_ids):
+            if isinstance(used_id, Exception):
+                logging.error("Error writing article %s: %s", articles[i].url, used_id)
+                results[i] = used_id
+            else:
+                results[i]["firestore_id"] = used_id
+        return results
+
+    @staticmethod
+    def _full_text(article: ArticleRaw) -> str:
         # For now: just use the title as the full doc.
         full_text = normalize_space(article.title.strip())
         logging.info(f"Processing {article.title} with full text {full_text}")
+        return full_text
 
-        # 1) Entities (canonical + sentence-level spans)
-        # We don't have the body text yet; pass empty string for text.
-        canonical = self.entities_extractor.build(full_text)
+    def _write(self, article: ArticleRaw, canonical: List[Dict[str, Any]]) -> Dict[str, Any]:
+        summary, write_kwargs = self._summarize(article, canonical)
+        if not self.dry_run:
+            summary["firestore_id"] = self.writer.write_article(**write_kwargs)
+        return summary
+
+    @staticmethod
+    def _summarize(article: ArticleRaw, canonical: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Returns the article's summary dict and the keyword arguments for writing it."""
         logging.info(f"Entities are {canonical}")
 
         summary = {
@@ -74,33 +138,38 @@ class ArticleProcessor:
         }
 
         country = getattr(article, "sourcecountry", None)
-        try:
-            country_code = pycountry.countries.lookup(country).alpha_3
-        except Exception:
-            print(f"Unknown country: {country}")
-            country_code = None
-
-        if not self.dry_run:
-            # Prepare Firestore write with your schema
-            used_id = self.writer.write_article(
-                title=article.title,
-                text=getattr(article, "text", "") or "",  
-                country=country_code,
-                time_val=datetime.fromisoformat(getattr(article, "seendate")),
-                entities_canonical=canonical,
-                url=getattr(article, "url", None),
-            )
-            summary["firestore_id"] = used_id
-        return summary
+        country_code = _CC3.get((country or "").upper())
+        if country_code is None:
+            logging.warning("Unknown country: %s", country)
+
+        # Prepare Firestore write with your schema
+        write_kwargs = dict(
+            title=article.title,
+            text=getattr(article, "text", "") or "",
+            country=country_code,
+            time_val=datetime.fromisoformat(getattr(article, "seendate")),
+            entities_canonical=canonical,
+            url=getattr(article, "url", None),
+        )
+        return summary, write_kwargs
     
 # =========================
 # Example usage
 # =========================
 
 if __name__ == "__main__":
+    import ast
+    from logging_setup import configure
+    configure()
+
     with open("/home/petar/Downloads/downloaded-logs-20251028-230836.json", 'rb') as file:
         articles_logs = json.load(file)
-    articles_jsons = [a['textPayload'][2:-1] for a in articles_logs if 'textPayload' in a]
+    # Publisher log lines are the article JSON; older ones are a bytes repr (b'...').
+    articles_jsons = [
+        ast.literal_eval(a['textPayload']).decode("utf-8") if a['textPayload'].startswith(("b'", 'b"'))
+        else a['textPayload']
+        for a in articles_logs if 'textPayload' in a
+    ]
     articles = []
     for article_json in articles_jsons:
         try:
@@ -114,4 +183,4 @@ if __name__ == "__main__":
     for article in articles:
         # print(article.sourcecountry)
         summary = sb.process_article(article)
-    print("Summary:", summary)
+    logging.info("Summary: %s", summary)
@@ -3,7 +3,11 @@ from dataclasses import dataclass
 from typing import Any, Dict
 
 
-@dataclass
+# ArticleRaw fields GDELT may leave out or send as null
+_OPTIONAL = ("url_mobile", "socialimage", "domain", "language", "sourcecountry")
+
+
+@dataclass(slots=True, frozen=True)
 class ArticleRaw:
     url: str
     title: str
@@ -21,11 +25,7 @@ class ArticleRaw:
             url=d["url"],
             title=d["title"],
             seendate=d["seendate"],
-            url_mobile=d.get("url_mobile", "") or "",
-            socialimage=d.get("socialimage", "") or "",
-            domain=d.get("domain", "") or "",
-            language=d.get("language", "") or "",
-            sourcecountry=d.get("sourcecountry", "") or "",
+            **{k: d.get(k) or "" for k in _OPTIONAL},
         )
 
 
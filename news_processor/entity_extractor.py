@@ -1,5 +1,5 @@
 
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from ai_api_loader import AIAPILoader
 
@@ -12,27 +12,42 @@ class EntityExtractor:
     ENTITY_TYPE_FILTER = {
         "PERSON", "LOCATION", "ORGANIZATION",
     }
+    # metadata keys that tie an entity to a real-world one
+    _ID_KEYS = frozenset({"wikipedia_url", "mid"})
 
     def __init__(self, api: AIAPILoader):
         self.api = api
 
-    def build(self, text) -> Dict[str, Any]:
-        api_ents = self.api.extract_entities(text)
-        # we filter the entities on type and Wikipedia link or Knowledge Graph ID (mid)
-        # since the entity extraction is too fine an tags abstract entities (e.g. man, street)
-        api_ents = [e for e in api_ents 
-                    if e.get("type") in self.ENTITY_TYPE_FILTER 
-                    and ('wikipedia_url' in e['metadata'] or 'mid' in e['metadata'])]
-
-        # Simple canonical table by representative name
-        canonical: Dict[str, Dict[str, Any]] = {}
+    def build(self, text) -> List[Dict[str, Any]]:
+        return self._canonical(self.api.extract_entities(text))
+
+    async def build_many_async(self, texts: List[str]) -> List[Any]:
+        """
+        Same as build for each text, with a single /entities:batch round-trip.
+        A text the API failed on gets its exception instead of a list.
+        """
+        return [self._canonical_or_error(r) for r in await self.api.extract_entities_batch_async(texts)]
+
+    def _canonical_or_error(self, api_ents: Any) -> Any:
+        return api_ents if isinstance(api_ents, Exception) else self._canonical(api_ents)
+
+    def _canonical(self, api_ents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Canonical entities as [{"type", "name"}, ...], one per representative name
+        (first occurrence wins), in API order.
+        """
+        seen = set()
+        out: List[Dict[str, Any]] = []
         for e in api_ents:
+            # we filter the entities on type and Wikipedia link or Knowledge Graph ID (mid)
+            # since the entity extraction is too fine an tags abstract entities (e.g. man, street)
+            if e.get("type") not in self.ENTITY_TYPE_FILTER:
+                continue
+            if self._ID_KEYS.isdisjoint(e.get("metadata") or ()):
+                continue
             name = e["name"]
-            if name not in canonical:
-                canonical[name] = {
-                    "type": e.get("type") or "OTHER",
-                    "name": name,
-                }
-
-
-        return canonical
\ No newline at end of file
+            if name in seen:
+                continue
+            seen.add(name)
+            out.append({"type": e.get("type") or "OTHER", "name": name})
+        return out
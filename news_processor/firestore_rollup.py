@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import functools
 import re
 from dataclasses import dataclass
 from datetime import datetime, timezone
@@ -8,12 +9,17 @@ from typing import Any, Dict, Optional, Sequence
 from google.cloud import firestore
 
 
+# Articles arriving together share timestamps; fromisoformat accepts a trailing
+# "Z" on Python 3.11+, so the string can be parsed (and cached) as is.
+parse_iso = functools.lru_cache(maxsize=4096)(datetime.fromisoformat)
+
+
 def _to_utc(dt: Any) -> datetime:
     """Accepts Firestore Timestamp, datetime, or ISO string -> aware UTC datetime."""
     if hasattr(dt, "to_datetime"):
         dt = dt.to_datetime()
     if isinstance(dt, str):
-        dt = datetime.fromisoformat(dt.replace("Z", "+00:00"))
+        dt = parse_iso(dt)
     if not isinstance(dt, datetime):
         raise TypeError(f"Unsupported time value: {type(dt)}")
     return dt.astimezone(timezone.utc) if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
@@ -24,10 +30,12 @@ def hour_bucket(dt_utc: datetime) -> str:
 
 
 _slug_re = re.compile(r"[^\w\s-]", re.UNICODE)
+_slug_ws_re = re.compile(r"\s+")
+@functools.lru_cache(maxsize=8192)
 def slugify(s: str, max_len: int = 128) -> str:
     s = (s or "").lower()
     s = _slug_re.sub("", s)
-    s = re.sub(r"\s+", "-", s.strip())
+    s = _slug_ws_re.sub("-", s.strip())
     return s[:max_len] or "entity"
 
 
@@ -82,6 +90,7 @@ class FirestoreRollup:
                 mentions_hour,
                 {
                     "hour": hour,
+                    "updated_at": firestore.SERVER_TIMESTAMP,
                 },
                 merge=True,
             )
@@ -101,7 +110,9 @@ class FirestoreRollup:
                 merge=True,
             )
 
-            # For each entity in the article, bump both directions
+            # For each entity in the article, bump both directions.
+            # The entity x country docs are pure counters: no timestamps (the hour doc
+            # carries updated_at), which keeps the transaction to fewer field transforms.
             for ent in entities:
                 name = (ent or {}).get("name")
                 if not name:
@@ -130,8 +141,6 @@ class FirestoreRollup:
                     {
                         "country": country,
                         "count": firestore.Increment(1),
-                        "updated_at": firestore.SERVER_TIMESTAMP,
-                        "created_at": firestore.SERVER_TIMESTAMP,
                     },
                     merge=True,
                 )
@@ -145,8 +154,6 @@ class FirestoreRollup:
                         "entity": name,
                         "type": etype,
                         "count": firestore.Increment(1),
-                        "updated_at": firestore.SERVER_TIMESTAMP,
-                        "created_at": firestore.SERVER_TIMESTAMP,
                     },
                     merge=True,
                 )
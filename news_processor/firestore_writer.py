@@ -1,25 +1,34 @@
 # firestore_writer.py
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
 import hashlib
+import os
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
+from google.api_core.exceptions import AlreadyExists
 from google.cloud import firestore
+from google.cloud.firestore_v1.bulk_writer import BulkWriteFailure, BulkWriter
 
-from firestore_rollup import FirestoreRollup, hour_bucket  # import from above
+from firestore_rollup import FirestoreRollup, hour_bucket, parse_iso  # import from above
 
 
 def _parse_time_to_utc(time_val: Any) -> datetime:
     if isinstance(time_val, datetime):
         dt = time_val
     elif isinstance(time_val, str):
-        dt = datetime.fromisoformat(time_val.replace("Z", "+00:00"))
+        dt = parse_iso(time_val)
     else:
         raise TypeError(f"Unsupported time type: {type(time_val)}")
     return dt.astimezone(timezone.utc) if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
 
 
+# Rollup transactions in flight at once in write_articles
+ROLLUP_CONCURRENCY = int(os.getenv("ROLLUP_CONCURRENCY", "32"))
+_ALREADY_EXISTS = 6  # gRPC status code reported by BulkWriter for create() on an existing doc
+
+
 def _deterministic_article_id(url: Optional[str], title: str, dt_utc: datetime) -> str:
     basis = url or f"{title}||{hour_bucket(dt_utc)}"
     return hashlib.sha256(basis.encode("utf-8")).hexdigest()[:32]
@@ -41,27 +50,18 @@ class FirestoreWriter:
         self.articles = self.client.collection(collection)
         self.rollup = rollup or FirestoreRollup(self.client)
 
-    def _normalize_entities(self, canonical: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
-        ents = []
-        for _, meta in canonical.items():
-            name = meta.get("name")
-            if not name:
-                continue
-            ents.append({"name": name, "type": meta.get("type") or "OTHER"})
-        return ents
+    def _normalize_entities(self, canonical: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # EntityExtractor already yields unique, named {"type", "name"} dicts
+        return list(canonical)
     
-    @firestore.transactional
     @staticmethod
-    def _tx_write(tx: firestore.Transaction, doc_ref, payload):
-        snap = doc_ref.get(transaction=tx)
-        if snap.exists:
-            tx.set(doc_ref, payload, merge=True)
-        else:
-            tx.set(
-                doc_ref,
-                {**payload, "created_at": firestore.SERVER_TIMESTAMP},
-                merge=False,
-            )
+    def _upsert(doc_ref, payload) -> None:
+        # create() fails if the doc exists, so created_at is only ever set once;
+        # a redelivered article merges in (keeping hour/rollups_done). No read needed.
+        try:
+            doc_ref.create({**payload, "created_at": firestore.SERVER_TIMESTAMP})
+        except AlreadyExists:
+            doc_ref.set(payload, merge=True)
 
     def write_article(
         self,
@@ -70,11 +70,90 @@ class FirestoreWriter:
         text: str,
         country: Optional[str],
         time_val: Any,
-        entities_canonical: Dict[str, Dict[str, Any]],
+        entities_canonical: List[Dict[str, Any]],
         url: Optional[str] = None,
         extra_fields: Optional[Dict[str, Any]] = None,
         doc_id: Optional[str] = None,
     ) -> str:
+        used_doc_id, doc_ref, payload = self._prepare(
+            title=title,
+            text=text,
+            country=country,
+            time_val=time_val,
+            entities_canonical=entities_canonical,
+            url=url,
+            extra_fields=extra_fields,
+            doc_id=doc_id,
+        )
+        self._upsert(doc_ref, payload)
+
+        # Now apply rollups safely (transactional + idempotent)
+        self.rollup.apply_for_article(doc_ref)
+
+        return used_doc_id
+
+    def write_articles(self, articles: Iterable[Dict[str, Any]]) -> List[Any]:
+        """
+        write_article for many articles (each item holds write_article's keyword
+        arguments). The article docs go out through one BulkWriter instead of a
+        round-trip each; the rollup transactions then run in parallel, at most
+        ROLLUP_CONCURRENCY at a time.
+        Returns, per article, its doc id or the exception that prevented the write.
+        """
+        prepared = [self._prepare(**kw) for kw in articles]
+        payloads = {doc_ref.path: payload for _, doc_ref, payload in prepared}
+        existing: List[Any] = []
+        failed: Dict[str, Exception] = {}
+
+        def on_error(failure: BulkWriteFailure, _: BulkWriter) -> bool:
+            if failure.code == _ALREADY_EXISTS:
+                existing.append(failure.operation.reference)
+                return False
+            if failure.attempts < 5:
+                return True
+            failed[failure.operation.reference.path] = RuntimeError(failure.message)
+            return False
+
+        bulk = self.client.bulk_writer()
+        bulk.on_write_error(on_error)
+        for _, doc_ref, payload in prepared:
+            bulk.create(doc_ref, {**payload, "created_at": firestore.SERVER_TIMESTAMP})
+        bulk.close()
+        if existing:
+            # A closed BulkWriter silently drops anything enqueued on it afterwards,
+            # so the merges for redelivered articles go through a writer of their own.
+            merges = self.client.bulk_writer()
+            merges.on_write_error(on_error)
+            for doc_ref in existing:
+                merges.set(doc_ref, payloads[doc_ref.path], merge=True)
+            merges.close()
+
+        # Rollup docs are shared between articles, so each article keeps its own
+        # transaction; those are independent and need not run back to back.
+        written = [doc_ref for _, doc_ref, _ in prepared if doc_ref.path not in failed]
+        with ThreadPoolExecutor(max_workers=ROLLUP_CONCURRENCY) as pool:
+            futures = {
+                doc_ref.path: pool.submit(self.rollup.apply_for_article, doc_ref)
+                for doc_ref in written
+            }
+        results: List[Any] = []
+        for used_doc_id, doc_ref, _ in prepared:
+            err = failed.get(doc_ref.path) or futures[doc_ref.path].exception()
+            results.append(err if err is not None else used_doc_id)
+        return results
+
+    def _prepare(
+        self,
+        *,
+        title: str,
+        text: str,
+        country: Optional[str],
+        time_val: Any,
+        entities_canonical: List[Dict[str, Any]],
+        url: Optional[str] = None,
+        extra_fields: Optional[Dict[str, Any]] = None,
+        doc_id: Optional[str] = None,
+    ) -> Tuple[str, firestore.DocumentReference, Dict[str, Any]]:
         dt_utc = _parse_time_to_utc(time_val)
         entities = self._normalize_entities(entities_canonical)
         entity_names = [e["name"] for e in entities]
@@ -95,12 +174,4 @@ class FirestoreWriter:
         }
         if extra_fields:
             payload.update(extra_fields)
-
-
-        tx = self.client.transaction()
-        self._tx_write(tx, doc_ref, payload)
-
-        # Now apply rollups safely (transactional + idempotent)
-        self.rollup.apply_for_article(doc_ref)
-
-        return used_doc_id
+        return used_doc_id, doc_ref, payload
@@ -0,0 +1,21 @@
+# logging_setup.py
+"""
+Routes stdlib logging to Cloud Logging. Entry points (app.py, scripts) call
+configure(); library modules only `import logging`.
+"""
+import threading
+
+import google.cloud.logging
+
+_configured = False
+_lock = threading.Lock()
+
+
+def configure() -> None:
+    """Attach the Cloud Logging handler to the root logger, once per process."""
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        google.cloud.logging.Client().setup_logging()
+        _configured = True
@@ -0,0 +1,83 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import firestore
+from google.cloud.firestore_v1.bulk_writer import BulkWriter, BulkWriterOptions, SendMode
+from google.cloud.firestore_v1.types import BatchWriteResponse, WriteResult
+from google.rpc import status_pb2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firestore_writer import FirestoreWriter, _ALREADY_EXISTS  # noqa: E402
+
+
+class RecordingBulkWriter(BulkWriter):
+    """
+    The real BulkWriter with only the RPC swapped out: creates of paths in
+    `existing` fail with ALREADY_EXISTS, every other write is recorded as committed.
+    """
+
+    def __init__(self, client, existing, committed):
+        super().__init__(client, BulkWriterOptions(mode=SendMode.serial))
+        self.existing = existing
+        self.committed = committed
+
+    def _send(self, batch):
+        statuses, results = [], []
+        for pb in batch._write_pbs:
+            path = pb.update.name
+            is_create = "current_document" in pb and not pb.current_document.exists
+            if is_create and path in self.existing:
+                statuses.append(status_pb2.Status(code=_ALREADY_EXISTS, message="exists"))
+            else:
+                statuses.append(status_pb2.Status(code=0))
+                self.committed.append(pb)
+            results.append(WriteResult())
+        return BatchWriteResponse(write_results=results, status=statuses)
+
+
+def _article(url):
+    return dict(
+        title=f"title {url}",
+        text="",
+        country="BGR",
+        time_val="2025-10-29T08:00:00+00:00",
+        entities_canonical=[{"type": "PERSON", "name": "Someone"}],
+        url=url,
+    )
+
+
+class WriteArticlesTest(unittest.TestCase):
+    def setUp(self):
+        client = firestore.Client(project="test", credentials=AnonymousCredentials())
+        self.writer = FirestoreWriter.__new__(FirestoreWriter)
+        self.writer.client = mock.Mock(wraps=client)
+        self.writer.articles = client.collection("articles")
+        self.writer.rollup = mock.Mock()
+        self.existing = set()
+        self.committed = []
+        self.writer.client.bulk_writer.side_effect = lambda: RecordingBulkWriter(
+            client, self.existing, self.committed
+        )
+
+    def test_existing_articles_are_merged(self):
+        old, new = _article("https://a.example/old"), _article("https://a.example/new")
+        _, old_ref, _ = self.writer._prepare(**old)
+        self.existing.add(old_ref._document_path)
+
+        ids = self.writer.write_articles([old, new])
+
+        self.assertEqual(len(ids), 2)
+        self.assertFalse(any(isinstance(i, Exception) for i in ids))
+        merges = [pb for pb in self.committed if pb.update.name == old_ref._document_path]
+        self.assertEqual(len(merges), 1)
+        self.assertTrue(merges[0].update_mask.field_paths)  # set(..., merge=True)
+        self.assertNotIn("created_at", merges[0].update_mask.field_paths)
+        self.assertEqual(self.writer.rollup.apply_for_article.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
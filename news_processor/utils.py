@@ -1,7 +1,6 @@
 
 from datetime import datetime, timezone
 import hashlib
-import re
 import time
 from dateutil import parser as dtparser
 
@@ -13,7 +12,8 @@ def sha1_hex(s: str) -> str:
     return hashlib.sha1(s.encode("utf-8")).hexdigest()
 
 def normalize_space(s: str) -> str:
-    return re.sub(r"\s+", " ", s).strip()
+    # split() with no separator drops leading/trailing whitespace and collapses runs
+    return " ".join(s.split())
 
 def now_ms() -> int:
     return int(time.time() * 1000)
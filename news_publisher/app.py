@@ -1,10 +1,12 @@
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+from concurrent import futures as cf
 from datetime import datetime, timedelta, timezone
-import os, json, requests, hashlib
+import os, requests, hashlib
 from typing import List, Dict, Optional
 import logging
 
+import orjson
 from google.cloud import pubsub_v1
 import google.cloud.logging
 
@@ -15,8 +17,18 @@ client.setup_logging()
 PROJECT_ID = os.environ["PROJECT_ID"] 
 TOPIC_ID = os.environ["TOPIC_ID"] 
 SOURCE_NAME = os.getenv("SOURCE_NAME", "gdelt") 
-
-publisher = pubsub_v1.PublisherClient() 
+PUBLISH_TIMEOUT = float(os.getenv("PUBLISH_TIMEOUT", "60"))  # seconds, for the whole run
+
+# Messages are published without waiting on each other; the client coalesces
+# them into batched publish RPCs.
+publisher = pubsub_v1.PublisherClient(
+    batch_settings=pubsub_v1.types.BatchSettings(
+        max_messages=100,
+        max_bytes=1024 * 1024,
+        max_latency=0.05,
+    ),
+    publisher_options=pubsub_v1.types.PublisherOptions(enable_message_ordering=False),
+)
 logging.info(f"Using topic {TOPIC_ID} in project {PROJECT_ID}")
 topic_path = publisher.topic_path(PROJECT_ID, TOPIC_ID)
 app = FastAPI()
@@ -26,8 +38,9 @@ class RunBody(BaseModel):
     end: Optional[str] = None     # ISO8601 (UTC)
     window_minutes: int = 60
 
-def sha256(s: str) -> str:
-    import hashlib; return hashlib.sha256(s.encode("utf-8")).hexdigest()
+def article_id(s: str) -> str:
+    # Deterministic, non-cryptographic id: BLAKE2b is faster than SHA-256 here
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=16).hexdigest()
 
 # ---- Upstream error types that carry context --------------------------------
 class UpstreamTemporaryError(Exception):
@@ -59,14 +72,20 @@ def _upstream_context(resp: requests.Response, note: str) -> Dict:
     }
 
 # ---- GDELT fetch -------------------------------------------------------------
+def _gdelt_fmt(dt: datetime) -> str:
+    """YYYYMMDDHHMMSS in UTC, the format GDELT's start/enddatetime expect."""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return f"{dt.year:04d}{dt.month:02d}{dt.day:02d}{dt.hour:02d}{dt.minute:02d}{dt.second:02d}"
+
 def fetch_gdelt(start_iso: str, end_iso: str) -> List[Dict]:
     BASE = "https://api.gdeltproject.org/api/v2/doc/doc"
 
     start_dt = datetime.fromisoformat(start_iso.replace("Z", "+00:00"))
     end_dt   = datetime.fromisoformat(end_iso.replace("Z", "+00:00"))
 
-    start_str = start_dt.strftime("%Y%m%d%H%M%S")
-    end_str   = end_dt.strftime("%Y%m%d%H%M%S")
+    start_str = _gdelt_fmt(start_dt)
+    end_str   = _gdelt_fmt(end_dt)
 
     params = {
         "query": "sourcelang:english",
@@ -161,14 +180,31 @@ async def run(body: RunBody):
             detail={"ok": False, "error": f"Unexpected error: {e}", "start": start_iso, "end": end_iso},
         )
 
-    published = 0
+    pending = []
     for a in batch:
         key = (a.get("url") or "") + "|" + (a.get("published_at") or start_iso)
-        a["article_id"] = sha256(key)
-        data = json.dumps(a).encode("utf-8")
-        logging.info(data)
-        future = publisher.publish(topic_path, data); 
-        future.result()
-        published += 1
-
-    return {"ok": True, "source": SOURCE_NAME, "start": start_iso, "end": end_iso, "count": published}
+        a["article_id"] = article_id(key)
+        data = orjson.dumps(a)
+        logging.info(data.decode("utf-8"))  # plain JSON; news_processor's replay reads it back
+        pending.append(publisher.publish(topic_path, data))
+
+    done, not_done = cf.wait(pending, timeout=PUBLISH_TIMEOUT)
+    published = 0
+    for future in done:
+        err = future.exception()
+        if err is None:
+            published += 1
+        else:
+            logging.error("Publish failed: %s", err)
+    failed = len(pending) - published
+    if not_done:
+        logging.error("%d publishes still pending after %ss", len(not_done), PUBLISH_TIMEOUT)
+
+    if pending and not published:
+        # 503 so Cloud Scheduler retries
+        raise HTTPException(
+            status_code=503,
+            detail={"ok": False, "error": f"All {failed} publishes failed", "start": start_iso, "end": end_iso},
+        )
+
+    return {"ok": True, "source": SOURCE_NAME, "start": start_iso, "end": end_iso, "count": published, "failed": failed}